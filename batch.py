@@ -0,0 +1,150 @@
+import argparse
+import logging
+import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterable, Iterator, TextIO
+
+from current_weather_data import CurrentWeatherData
+from export import EXPORT_FORMATS, RecordWriter, open_export, parse_fields
+from five_day_forecast_data import FiveDayForecastData
+from metrics import write_if_enabled
+from response_cache import format_search_params
+from weather_manager import WeatherManager
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Mönster för rader i platsfilen. Allt som inte är koordinater eller postnummer tolkas som ett stadsnamn.
+LAT_LON_PATTERN: re.Pattern[str] = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")  # Ex. "59.33,18.07"
+ZIP_PATTERN: re.Pattern[str] = re.compile(r"^\s*(\d[\d ]*\d)\s*,\s*([A-Za-z]{2})\s*$")  # Ex. "114 55,SE"
+
+# Prognostyperna som kan väljas i batchläget och deras motsvarande sträng i URL-länken
+FORECAST_TYPES: dict[str, str] = {"current": "weather?", "forecast": "forecast?"}
+
+# Hur många förfrågningar per tråd som får ligga i kö samtidigt. Begränsar minnet när platsfilen är mycket stor.
+QUEUED_PER_WORKER: int = 4
+
+
+def parse_location(line: str, weather: WeatherManager | None = None) -> str:
+    """Tolkar en rad från platsfilen och returnerar den parametersträng som söktypen kräver i API URL-länken,
+    exempelvis '&lat=59.33&lon=18.07', '&zip=114%2055,SE' eller '&q=Stockholm'.
+    Om en WeatherManager anges slås städer och postnummer upp i dess ortregister så att koordinater kan skickas direkt."""
+
+    if match := LAT_LON_PATTERN.match(line):
+        return format_search_params({"lat": match.group(1), "lon": match.group(2)})
+    if match := ZIP_PATTERN.match(line):
+        if weather is not None:
+            return weather.zip_search_params(match.group(1), match.group(2).upper())
+        return format_search_params({"zip": f"{match.group(1)},{match.group(2).upper()}"})
+    if weather is not None:
+        return weather.city_search_params(line.strip())
+    return format_search_params({"q": line.strip()})
+
+
+def read_locations(source: TextIO) -> Iterator[str]:
+    """Läser platser rad för rad. Tomma rader och rader som börjar med '#' hoppas över."""
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def fetch_all(
+    weather: WeatherManager, locations: Iterable[str], forecast_types: list[str], max_workers: int = 8
+) -> Iterator[tuple[str, str, Any, Exception | None]]:
+    """Hämtar väderdata för alla platser och prognostyper parallellt med en begränsad trådpool.
+    Resultaten returneras i den ordning de blir klara, så en långsam eller misslyckad plats håller inte upp de andra.
+    Platserna läses in först när det finns plats i kön, så minnesanvändningen är densamma oavsett hur många platser som hämtas.
+    Varje resultat är en tupel med (plats, prognostyp, data, fel)."""
+
+    max_queued: int = max_workers * QUEUED_PER_WORKER
+    pending: dict[Future[Any], tuple[str, str]] = {}
+    remaining: Iterator[str] = iter(locations)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Fyller på kön tills den är full eller platserna är slut
+            while len(pending) < max_queued:
+                location: str | None = next(remaining, None)
+                if location is None:
+                    break
+                search_type: str = parse_location(location, weather)
+                for forecast_type in forecast_types:
+                    pending[executor.submit(weather.request_data, forecast_type, search_type)] = (location, forecast_type)
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                location, forecast_type = pending.pop(future)
+                try:
+                    yield location, forecast_type, future.result(), None
+                except Exception as e:
+                    logger.error("Kunde inte hämta %s för %s: %s", forecast_type, location, e)
+                    yield location, forecast_type, None, e
+
+
+def iter_records(forecast_type: str, data: Any) -> Iterator[dict[str, Any]]:
+    """Returnerar de exporterbara posterna för ett svar: en post för nuvarande väder, en per tidsprognos för 5-dagarsprognosen."""
+    if forecast_type == "weather?":
+        yield CurrentWeatherData(data).to_record()
+    else:
+        yield from FiveDayForecastData(data).iter_records()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Kör batchläget utan interaktiva menyer. Returnerar 1 om minst en plats misslyckades, annars 0."""
+    from main import OPENWEATHERMAP_API_KEY
+
+    parser = argparse.ArgumentParser(description="Hämtar väder för många platser parallellt.")
+    parser.add_argument("file", nargs="?", default="-", help="Fil med en plats per rad (stad, 'postnummer,landskod' eller 'lat,lon'). '-' läser från stdin.")
+    parser.add_argument("--type", choices=["current", "forecast", "both"], default="current", help="Typ av väderprognos som ska hämtas.")
+    parser.add_argument("--workers", type=int, default=8, help="Max antal samtidiga förfrågningar.")
+    parser.add_argument("--width", type=int, default=40, help="Bredd på linjeramen.")
+    parser.add_argument("--export", metavar="PATH", help="Skriver väderdatan som NDJSON eller CSV till filen istället för att printa linjeramar. '-' skriver till stdout.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson", help="Exportformat.")
+    parser.add_argument("--fields", help="Kommaseparerad lista med fält som ska exporteras, exempelvis 'city,temperature'.")
+    parser.add_argument("--gzip", action="store_true", help="Komprimerar exporten med gzip.")
+    args = parser.parse_args(argv)
+
+    forecast_types: list[str] = list(FORECAST_TYPES.values()) if args.type == "both" else [FORECAST_TYPES[args.type]]
+    weather: WeatherManager = WeatherManager(OPENWEATHERMAP_API_KEY)
+
+    source: TextIO = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    sink: TextIO | None = open_export(args.export, args.gzip) if args.export else None
+    kinds: list[str] = [kind for kind, forecast_type in FORECAST_TYPES.items() if forecast_type in forecast_types]
+    writer: RecordWriter | None = RecordWriter(sink, args.format, parse_fields(args.fields), kinds) if sink is not None else None
+    failures: int = 0
+    try:
+        for location, forecast_type, data, error in fetch_all(weather, read_locations(source), forecast_types, args.workers):
+            if error is not None:
+                failures += 1
+                print(f"Kunde inte hämta väderinformation för {location}: {error}", file=sys.stderr)
+                continue
+            try:
+                if writer is not None:
+                    # Hela svaret tolkas innan något skrivs, så att ett trasigt svar inte lämnar halva poster i exporten
+                    writer.write_all(list(iter_records(forecast_type, data)))
+                elif forecast_type == "weather?":
+                    CurrentWeatherData(data).print_weather(width=args.width)
+                else:
+                    FiveDayForecastData(data).print_forecast_data(width=args.width)
+            except (KeyError, IndexError, TypeError, ValueError) as e:  # Ett svar som saknar fält eller har fel format stoppar inte resten
+                failures += 1
+                logger.error("Kunde inte tolka %s för %s: %s", forecast_type, location, e)
+                print(f"Kunde inte tolka väderinformationen för {location}: {e}", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not None and sink is not sys.stdout:
+            sink.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        write_if_enabled()  # Sparar mätvärdena om de är påslagna (WEATHERAPP_METRICS=1)
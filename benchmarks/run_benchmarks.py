@@ -0,0 +1,213 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import date as Date, datetime, timedelta
+from typing import Any, Callable
+
+from batch import fetch_all
+from box_print import BoxRenderer
+from current_weather_data import CurrentWeatherData
+from five_day_forecast_data import FiveDayForecastData
+from gazetteer import Gazetteer
+from historical_archive import HistoricalArchive
+from historical_data import HistoricalData, HistoricalManager
+from http_transport import HttpTransport
+from metrics import metrics
+from response_cache import ResponseCache
+from weather_manager import WeatherManager
+
+from benchmarks.stub_server import StubServer
+
+
+def no_cache() -> ResponseCache:
+    """Returnerar en cache som aldrig sparar något, så att varje anrop går hela vägen till servern."""
+    return ResponseCache(path=None, max_entries=0)
+
+
+def summarize(durations: list[float], total_seconds: float, operations: int) -> dict[str, float]:
+    """Räknar ut latens (i millisekunder) och genomströmning för en serie mätningar."""
+    ordered: list[float] = sorted(durations)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "operations": operations,
+        "total_s": total_seconds,
+        "throughput_per_s": operations / total_seconds if total_seconds else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def stage_summary() -> dict[str, dict[str, float]]:
+    """Sammanfattar mätvärdena per fas (antal och medeltid i millisekunder) samt räknarna från den senaste scenariokörningen."""
+    snapshot: dict[str, Any] = metrics.snapshot()
+    stages: dict[str, dict[str, float]] = {}
+    for histogram in snapshot["histograms"]:
+        name: str = "/".join([histogram["phase"], *histogram["labels"].values()])
+        stages[name] = {"count": histogram["count"], "mean_ms": histogram["sum"] / histogram["count"] * 1000}
+    counters: dict[str, int] = {"/".join([counter["name"], *counter["labels"].values()]): counter["value"] for counter in snapshot["counters"]}
+    return {"stages": stages, "counters": counters}
+
+
+def run_scenario(operation: Callable[[int], None], iterations: int) -> dict[str, Any]:
+    """Kör en operation ett antal gånger och mäter tiden för varje körning, från start till färdig utskrift."""
+    metrics.reset()
+    durations: list[float] = []
+    started: float = time.perf_counter()
+    for iteration in range(iterations):
+        operation_started: float = time.perf_counter()
+        operation(iteration)
+        durations.append(time.perf_counter() - operation_started)
+    total: float = time.perf_counter() - started
+    return {**summarize(durations, total, iterations), **stage_summary()}
+
+
+def benchmark_single(server: StubServer, forecast_type: str, iterations: int, cached: bool) -> dict[str, Any]:
+    """Mäter en enskild sökning: hämtning, tolkning och utskrift av nuvarande väder eller 5-dagarsprognos."""
+    transport: HttpTransport = HttpTransport()
+    weather: WeatherManager = WeatherManager(
+        "bench", cache=ResponseCache(path=None) if cached else no_cache(), transport=transport, gazetteer=Gazetteer(), base_url=server.owm_base_url
+    )
+
+    def operation(iteration: int) -> None:
+        # Med cache söks samma stad varje gång, utan cache en ny stad per körning
+        data: Any = weather.request_data(forecast_type, "&q=Stockholm" if cached else f"&q=Stad{iteration}")
+        renderer: BoxRenderer = BoxRenderer(io.StringIO())
+        if forecast_type == "weather?":
+            CurrentWeatherData(data).print_weather(40, renderer)
+        else:
+            FiveDayForecastData(data).print_forecast_data(40, renderer)
+        renderer.flush()
+
+    result: dict[str, Any] = run_scenario(operation, iterations)
+    result["connections"] = transport.connection_stats()
+    return result
+
+
+def benchmark_batch(server: StubServer, locations: int, workers: int, rounds: int, cache_path: str | None = None) -> dict[str, Any]:
+    """Mäter batchläget: många platser som hämtas parallellt med både nuvarande väder och 5-dagarsprognos.
+    Med cache_path sparas svaren i en cache på disk precis som vid en vanlig körning, och varje runda söker nya platser
+    så att alla svar sparas. Tiden för den sista skrivningen till disk räknas in i varje runda."""
+    transport: HttpTransport = HttpTransport(pool_maxsize=workers)
+    cache: ResponseCache = ResponseCache(path=cache_path) if cache_path is not None else no_cache()
+    weather: WeatherManager = WeatherManager("bench", cache=cache, transport=transport, gazetteer=Gazetteer(), base_url=server.owm_base_url)
+    failures: list[int] = [0]
+
+    def operation(iteration: int) -> None:
+        cities: list[str] = [f"Stad{index}" if cache_path is None else f"Stad{iteration}-{index}" for index in range(locations)]
+        renderer: BoxRenderer = BoxRenderer(io.StringIO())
+        for _, forecast_type, data, error in fetch_all(weather, cities, ["weather?", "forecast?"], workers):
+            if error is not None:
+                failures[0] += 1
+            elif forecast_type == "weather?":
+                CurrentWeatherData(data).print_weather(40, renderer)
+            else:
+                FiveDayForecastData(data).print_forecast_data(40, renderer)
+        renderer.flush()
+        cache.save()
+
+    result: dict[str, Any] = run_scenario(operation, rounds)
+    result["locations_per_s"] = locations * rounds / result["total_s"]
+    result["failures"] = failures[0]
+    if cache_path is not None:
+        result["cache_file_bytes"] = os.path.getsize(cache_path)
+    result["connections"] = transport.connection_stats()
+    return result
+
+
+def benchmark_historical_range(server: StubServer, days: int, iterations: int, archived: bool) -> dict[str, Any]:
+    """Mäter hämtning av ett historiskt datumintervall, antingen med ett tomt arkiv varje gång eller med ett redan fyllt arkiv."""
+    transport: HttpTransport = HttpTransport()
+    archive: HistoricalArchive = HistoricalArchive(":memory:")
+    start: Date = Date(2023, 1, 1)
+    end: Date = start + timedelta(days=days - 1)
+
+    def operation(iteration: int) -> None:
+        history: HistoricalManager = HistoricalManager(
+            "bench",
+            transport=transport,
+            archive=archive if archived else HistoricalArchive(":memory:"),
+            base_url=server.wwo_url,
+        )
+        renderer: BoxRenderer = BoxRenderer(io.StringIO())
+        HistoricalData(history.fetch_historical_range("Stockholm", start, end)).print_historical_data(renderer)
+        renderer.flush()
+
+    if archived:
+        operation(-1)  # Fyller arkivet innan mätningen
+    result: dict[str, Any] = run_scenario(operation, iterations)
+    result["days"] = days
+    result["connections"] = transport.connection_stats()
+    return result
+
+
+def current_commit() -> str | None:
+    """Returnerar git-hashen för den incheckning som mäts, så att resultat från olika incheckningar kan jämföras."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    """Kör alla scenarier mot den lokala testservern och sparar resultaten som JSON."""
+    parser = argparse.ArgumentParser(description="Mäter väderappens prestanda offline mot en lokal testserver.")
+    parser.add_argument("--iterations", type=int, default=50, help="Antal körningar per scenario för enskilda sökningar.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Serverns fasta fördröjning i sekunder.")
+    parser.add_argument("--jitter", type=float, default=0.005, help="Serverns slumpmässiga extra fördröjning i sekunder.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Andel förfrågningar som får svaret 503.")
+    parser.add_argument("--locations", type=int, default=100, help="Antal platser i batchscenariot.")
+    parser.add_argument("--workers", type=int, default=16, help="Antal samtidiga förfrågningar i batchscenariot.")
+    parser.add_argument("--days", type=int, default=365, help="Antal dagar i det historiska intervallet.")
+    parser.add_argument("--output", default="bench_results.json", help="Fil som resultaten sparas i.")
+    args = parser.parse_args()
+
+    server: StubServer = StubServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    metrics.enabled = True  # Mätningarna per fas behövs för resultaten
+    temp_dir: tempfile.TemporaryDirectory[str] = tempfile.TemporaryDirectory()  # För cachefilen i batchscenariot med cache på disk
+
+    scenarios: dict[str, Callable[[], dict[str, Any]]] = {
+        "single_current": lambda: benchmark_single(server, "weather?", args.iterations, cached=False),
+        "single_current_cached": lambda: benchmark_single(server, "weather?", args.iterations, cached=True),
+        "single_forecast": lambda: benchmark_single(server, "forecast?", args.iterations, cached=False),
+        "batch": lambda: benchmark_batch(server, args.locations, args.workers, rounds=3),
+        "batch_disk_cache": lambda: benchmark_batch(
+            server, args.locations, args.workers, rounds=3, cache_path=os.path.join(temp_dir.name, "weather_cache.json")
+        ),
+        "historical_range": lambda: benchmark_historical_range(server, args.days, iterations=5, archived=False),
+        "historical_range_archived": lambda: benchmark_historical_range(server, args.days, iterations=5, archived=True),
+    }
+
+    results: dict[str, Any] = {
+        "commit": current_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "scenarios": {},
+    }
+    for name, scenario in scenarios.items():
+        result: dict[str, Any] = scenario()
+        results["scenarios"][name] = result
+        print(f"{name:<28} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms   {result['throughput_per_s']:9.1f} op/s")
+
+    server.shutdown()
+    temp_dir.cleanup()
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Resultaten sparades i {args.output}")
+
+
+if __name__ == "__main__":
+    main()
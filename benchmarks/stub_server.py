@@ -0,0 +1,136 @@
+import argparse
+import copy
+import json
+import os
+import random
+import threading
+import time
+from datetime import date as Date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+
+# Mappen med inspelade svar från OpenWeatherMap och WorldWeatherOnline
+FIXTURES_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name: str) -> Any:
+    """Läser in ett inspelat API-svar från fixtures-mappen."""
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+        return json.load(file)
+
+
+class StubServer(ThreadingHTTPServer):
+    """En lokal HTTP-server som spelar upp inspelade svar från OpenWeatherMap och WorldWeatherOnline.
+    Fördröjningen och andelen felsvar (503) går att ställa in så att olika nätverksförhållanden kan efterliknas."""
+
+    daemon_threads: bool = True
+    request_queue_size: int = 256
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", port), StubRequestHandler)
+        self.latency: float = latency  # Fast fördröjning i sekunder per svar
+        self.jitter: float = jitter  # Slumpmässig extra fördröjning i sekunder, mellan 0 och jitter
+        self.error_rate: float = error_rate  # Andel av förfrågningarna (0-1) som får svaret 503
+        self.requests_served: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+        self.current_weather: Any = load_fixture("current_weather.json")
+        self.forecast: Any = load_fixture("forecast.json")
+        self.historical_day: Any = load_fixture("historical_day.json")
+
+    @property
+    def owm_base_url(self) -> str:
+        """Bas-URL som kan ges till WeatherManager."""
+        return f"http://127.0.0.1:{self.server_port}/data/2.5/"
+
+    @property
+    def wwo_url(self) -> str:
+        """URL som kan ges till HistoricalManager."""
+        return f"http://127.0.0.1:{self.server_port}/premium/v1/past-weather.ashx"
+
+    def start(self) -> "StubServer":
+        """Startar servern i en bakgrundstråd."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def historical_response(self, params: dict[str, str]) -> Any:
+        """Bygger ett svar med en dag per datum från 'date' till och med 'enddate' utifrån den inspelade dagen."""
+        start: Date = Date.fromisoformat(params["date"])
+        end: Date = Date.fromisoformat(params.get("enddate", params["date"]))
+        days: list[Any] = []
+        for offset in range((end - start).days + 1):
+            day: Any = copy.deepcopy(self.historical_day["data"]["weather"][0])
+            day["date"] = (start + timedelta(days=offset)).isoformat()
+            days.append(day)
+        return {"data": {"request": [{"type": "City", "query": params.get("q", "")}], "weather": days}}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Besvarar förfrågningar med inspelade svar beroende på sökvägen."""
+
+    protocol_version: str = "HTTP/1.1"  # Håller anslutningarna öppna så att klientens anslutningspool kan återanvändas
+    disable_nagle_algorithm: bool = True  # Skickar svaret direkt istället för att vänta på TCP-kvittens mellan rubriker och innehåll
+    server: StubServer
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        params: dict[str, str] = dict(parse_qsl(url.query))
+        with self.server._lock:
+            self.server.requests_served += 1
+
+        delay: float = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < self.server.error_rate:
+            self.send_json(503, {"cod": 503, "message": "Simulerat fel"}, {"Retry-After": "0"})
+            return
+
+        if url.path.endswith("/weather"):
+            body: Any = dict(self.server.current_weather, name=params.get("q", self.server.current_weather["name"]))
+        elif url.path.endswith("/forecast"):
+            body = self.server.forecast
+        elif url.path.endswith("/past-weather.ashx"):
+            body = self.server.historical_response(params)
+        else:
+            self.send_json(404, {"cod": 404, "message": "Okänd sökväg"})
+            return
+        self.send_json(200, body)
+
+    def send_json(self, status: int, body: Any, headers: dict[str, str] | None = None) -> None:
+        """Skickar ett JSON-svar."""
+        payload: bytes = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Stänger av loggningen av varje förfrågan så att den inte påverkar mätningarna."""
+
+
+def main() -> None:
+    """Startar testservern fristående. Peka WEATHERAPP_OWM_BASE_URL och WEATHERAPP_WWO_URL mot den för att köra appen offline."""
+    parser = argparse.ArgumentParser(description="Lokal testserver som spelar upp inspelade väder-API-svar.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="Fast fördröjning i sekunder per svar.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Slumpmässig extra fördröjning i sekunder.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Andel förfrågningar som får svaret 503.")
+    args = parser.parse_args()
+
+    server: StubServer = StubServer(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"WEATHERAPP_OWM_BASE_URL={server.owm_base_url}")
+    print(f"WEATHERAPP_WWO_URL={server.wwo_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,99 @@
+import io
+import sys
+import unicodedata
+from typing import TextIO
+
+
+def char_width(char: str) -> int:
+    """Returnerar hur många kolumner ett tecken tar upp i terminalen.
+    Breda tecken (t.ex. emoji) tar två kolumner, kombinerande tecken och variantväljare tar noll."""
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return 2
+    return 1
+
+
+def display_width(text: str) -> int:
+    """Returnerar textens bredd i terminalkolumner, till skillnad från len() som räknar tecken."""
+    width: int = 0
+    previous: str = ""
+    for char in text:
+        if char == "\ufe0f" and previous and char_width(previous) == 1:
+            width += 1  # Variantväljaren gör att föregående smala symbol visas som en bred emoji
+        width += char_width(char)
+        previous = char
+    return width
+
+
+def pad_right(text: str, width: int, fill: str = " ") -> str:
+    """Fyller ut texten till höger så att den blir minst width kolumner bred, som str.ljust fast för breda tecken."""
+    return text + fill * max(0, width - display_width(text))
+
+
+def center(text: str, width: int, fill: str = " ") -> str:
+    """Centrerar texten inom width kolumner, som str.center fast för breda tecken."""
+    padding: int = max(0, width - display_width(text))
+    left: int = padding // 2 + (padding & width & 1)  # Samma fördelning av utfyllnaden som str.center
+    return fill * left + text + fill * (padding - left)
+
+
+class BoxRenderer:
+    """Bygger upp linjeramade rutor i en buffert och skriver ut allt med en enda skrivning.
+    Används istället för ett print-anrop per rad när många rutor ska skrivas ut, exempelvis en hel prognos eller flera platser."""
+
+    def __init__(self, sink: TextIO | None = None) -> None:
+        self.sink: TextIO | None = sink  # Vart bufferten skrivs vid flush(), None betyder sys.stdout
+        self.buffer: io.StringIO = io.StringIO()
+
+    def line(self, text: str = "") -> None:
+        """Lägger till en fri textrad utan ram."""
+        self.buffer.write(text + "\n")
+
+    def centered(self, text: str, width: int) -> None:
+        """Lägger till en centrerad textrad utan ram."""
+        self.line(center(text, width))
+
+    def title(self, title: str, width: int) -> None:
+        """Lägger till en rubrik ihop med en överkantlinje och hörn."""
+        self.line("┌" + center(f"  {title}  ", width, "─") + "┐")
+
+    def body(self, body: str, width: int) -> None:
+        """Lägger till brödtexten eller innehållet för en ruta ihop med sidolinjer."""
+        self.line(pad_right(f"│ {body}", width) + " │")
+
+    def footer(self, width: int) -> None:
+        """Lägger till en underkant ihop med hörn."""
+        self.line("└" + "─" * width + "┘")
+
+    def getvalue(self) -> str:
+        """Returnerar det som har buffrats hittills."""
+        return self.buffer.getvalue()
+
+    def flush(self) -> None:
+        """Skriver hela bufferten till utdata med en skrivning och tömmer den."""
+        sink: TextIO = self.sink if self.sink is not None else sys.stdout
+        sink.write(self.buffer.getvalue())
+        sink.flush()
+        self.buffer = io.StringIO()
+
+
 def box_print_title(title: str, width: int) -> None:
     """Printar en rubrik ihop med en överkantlinje och hörn."""
-    print("┌" + f"  {title}  ".center(width, "─") + "┐")
+    renderer: BoxRenderer = BoxRenderer()
+    renderer.title(title, width)
+    renderer.flush()
 
 
 def box_print_body(body: str, width: int) -> None:
     """Printar brödtexten eller innehållet för en ruta ihop med sidolinjer."""
-    print(f"│ {body}".ljust(width) + " │")
+    renderer: BoxRenderer = BoxRenderer()
+    renderer.body(body, width)
+    renderer.flush()
 
 
 def box_print_footer(width: int) -> None:
     """Printar en underkant ihop med hörn."""
-    print("└" + "─" * width + "┘")
+    renderer: BoxRenderer = BoxRenderer()
+    renderer.footer(width)
+    renderer.flush()
@@ -1,10 +1,12 @@
 from typing import Any
-from box_print import box_print_title, box_print_body, box_print_footer
+from box_print import BoxRenderer
+from metrics import timed
 
 
 class CurrentWeatherData:
     """Hanterar och printar nuvarande väderprognosdata i lämpligt format."""
 
+    @timed("model_construction", model="CurrentWeatherData")
     def __init__(self, weather_data: dict) -> None:
         self.city: str = weather_data["name"]  # Sparar stadsnamn
         self.temperature: float = weather_data["main"]["temp"]  # Sparar temperatur
@@ -12,20 +14,38 @@ class CurrentWeatherData:
         self.weather_description: str = weather_data["weather"][0]["description"]  # Sparar väderbeskrivning
         self.weather_id: int = weather_data["weather"][0]["id"]  # Sparar väder-id
 
-    def print_weather(self, width: int) -> None:
-        """Printar prognosdatan med en omgivande linjeram."""
+    def to_record(self) -> dict[str, Any]:
+        """Returnerar nuvarande väder som en platt dictionary, lämplig för export som NDJSON eller CSV."""
+        return {
+            "kind": "current",
+            "city": self.city,
+            "temperature": self.temperature,
+            "feels_like": self.feels_like,
+            "weather_id": self.weather_id,
+            "description": self.weather_description,
+        }
+
+    @timed("rendering", model="CurrentWeatherData")
+    def print_weather(self, width: int, renderer: BoxRenderer | None = None) -> None:
+        """Printar prognosdatan med en omgivande linjeram.
+        Om en renderer anges läggs rutan till i dess buffert, annars skrivs den ut direkt med en skrivning."""
+        output: BoxRenderer = renderer if renderer is not None else BoxRenderer()
+
         weather_icon: str = f"{self.get_weather_icon()}"  # Hämtar väderikonen som motsvarar väderid-numret
-        print(weather_icon.center(width))  # Printa väderikonen
+        output.centered(weather_icon, width)  # Printa väderikonen
 
         title: str = self.city  # Sparar stadsnamnet
-        box_print_title(title, width)  # Printa rubriken med en överkant
+        output.title(title, width)  # Printa rubriken med en överkant
 
         # Printar f-strängarna med sidolinjer
         line1: str = f"Temperatur: {self.temperature} °C, {self.weather_description.capitalize()}"
         line2: str = f"Känns som: {self.feels_like} °C"
-        box_print_body(line1, width)  # Printar line1
-        box_print_body(line2, width)  # Printar line2
-        box_print_footer(width)  # Printa nedre kant
+        output.body(line1, width)  # Printar line1
+        output.body(line2, width)  # Printar line2
+        output.footer(width)  # Printa nedre kant
+
+        if renderer is None:
+            output.flush()
 
     def get_weather_icon(self) -> str:
         """Returnerar en väderikon (emoji) som motsvarar prognosdatans väderkod."""
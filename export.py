@@ -0,0 +1,136 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import date as Date
+from typing import Any, Iterable, TextIO
+
+from historical_archive import HistoricalArchive, default_archive
+from historical_data import historical_day_record, to_date
+
+
+# Formaten som kan exporteras
+EXPORT_FORMATS: tuple[str, ...] = ("ndjson", "csv")
+
+# Fälten i varje typ av post, i den ordning de skrivs som CSV-kolumner. Måste stämma med CurrentWeatherData.to_record,
+# FiveDayForecastData.iter_records och historical_day_record.
+RECORD_FIELDS: dict[str, tuple[str, ...]] = {
+    "current": ("kind", "city", "temperature", "feels_like", "weather_id", "description"),
+    "forecast": ("kind", "city", "timestamp", "date", "time", "temperature", "feels_like", "humidity", "wind_speed", "weather_id", "description"),
+    "historical": ("kind", "query", "date", "max_temp", "min_temp", "avg_temp", "sun_hours"),
+}
+
+
+def csv_columns(kinds: Iterable[str]) -> list[str]:
+    """Returnerar CSV-kolumnerna för en export med de angivna posttyperna: alla typers fält, utan dubbletter, i ordning."""
+    columns: list[str] = []
+    for kind in kinds:
+        columns.extend(field for field in RECORD_FIELDS[kind] if field not in columns)
+    return columns
+
+
+def parse_fields(value: str | None) -> list[str] | None:
+    """Tolkar en kommaseparerad lista med fältnamn, exempelvis 'city,date,temperature'. Returnerar None om inga fält angetts."""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+def open_export(path: str, compress: bool = False) -> TextIO:
+    """Öppnar en fil för export. '-' skriver till stdout. Filen gzip-komprimeras om compress anges eller om filnamnet slutar på '.gz'."""
+    compress = compress or path.endswith(".gz")
+    if path == "-":
+        if not compress:
+            return sys.stdout
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb"), encoding="utf-8", newline="")
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+class RecordWriter:
+    """Skriver platta dictionaries som NDJSON (ett JSON-objekt per rad) eller CSV, en post i taget,
+    så att även mycket stora exporter kan skrivas utan att alla poster hålls i minnet.
+    Med fields skrivs bara de angivna fälten, i den ordningen. Utan fields skrivs NDJSON-poster som de är,
+    och CSV-kolumnerna blir alla fält för posttyperna i kinds, så att poster av olika typer kan blandas i samma fil."""
+
+    def __init__(
+        self, sink: TextIO, format: str = "ndjson", fields: list[str] | None = None, kinds: Iterable[str] = tuple(RECORD_FIELDS)
+    ) -> None:
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Okänt exportformat: {format}. Välj mellan {', '.join(EXPORT_FORMATS)}.")
+        self.sink: TextIO = sink
+        self.format: str = format
+        self.fields: list[str] | None = fields
+        self.records_written: int = 0
+        self._csv_writer: csv.DictWriter | None = None  # Används bara för CSV, kolumnerna skrivs direkt så att även en tom export får en rubrikrad
+        if format == "csv":
+            # Valda fält är ett urval, så övriga fält hoppas över. Utan urval ska ett okänt fält ge ett fel istället för att försvinna tyst.
+            columns: list[str] = fields if fields is not None else csv_columns(kinds)
+            self._csv_writer = csv.DictWriter(sink, fieldnames=columns, extrasaction="ignore" if fields is not None else "raise")
+            self._csv_writer.writeheader()
+
+    def write(self, record: dict[str, Any]) -> None:
+        """Skriver en post."""
+        if self.format == "ndjson":
+            if self.fields is not None:
+                record = {field: record.get(field) for field in self.fields}
+            self.sink.write(json.dumps(record, ensure_ascii=False))
+            self.sink.write("\n")
+        else:
+            self._csv_writer.writerow(record)
+        self.records_written += 1
+
+    def write_all(self, records: Iterable[dict[str, Any]]) -> None:
+        """Skriver alla poster och tömmer bufferten efteråt, så att läsare i andra änden får dem direkt."""
+        for record in records:
+            self.write(record)
+        self.flush()
+
+    def flush(self) -> None:
+        """Tömmer bufferten till filen."""
+        self.sink.flush()
+
+
+def export_archive(
+    writer: RecordWriter, city: str, start_date: Date, end_date: Date, archive: HistoricalArchive | None = None
+) -> int:
+    """Exporterar arkiverade historiska dagar för en plats, sida för sida direkt från arkivet. Returnerar antalet exporterade dagar."""
+    archive = archive if archive is not None else default_archive()
+    query: str = archive.query_for(city) or city
+    written: int = writer.records_written
+    writer.write_all(historical_day_record(query, day) for day in archive.iter_days(city, start_date, end_date))
+    return writer.records_written - written
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Exporterar historiskt väder från arkivet utan nätverksanrop. Returnerar 1 om platsen saknas i arkivet, annars 0."""
+    parser = argparse.ArgumentParser(description="Exporterar arkiverat historiskt väder som NDJSON eller CSV.")
+    parser.add_argument("city", help="Stad som ska exporteras.")
+    parser.add_argument("start", help="Första datum (YYYY-MM-DD).")
+    parser.add_argument("end", help="Sista datum (YYYY-MM-DD).")
+    parser.add_argument("--output", default="-", help="Fil som exporten skrivs till. '-' skriver till stdout.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson", help="Exportformat.")
+    parser.add_argument("--fields", help="Kommaseparerad lista med fält som ska exporteras, exempelvis 'date,max_temp'.")
+    parser.add_argument("--gzip", action="store_true", help="Komprimerar exporten med gzip.")
+    args = parser.parse_args(argv)
+
+    archive: HistoricalArchive = default_archive()
+    if archive.query_for(args.city) is None:
+        print(f"{args.city} finns inte i arkivet.", file=sys.stderr)
+        return 1
+
+    sink: TextIO = open_export(args.output, args.gzip)
+    try:
+        writer: RecordWriter = RecordWriter(sink, args.format, parse_fields(args.fields), kinds=["historical"])
+        export_archive(writer, args.city, to_date(args.start), to_date(args.end), archive)
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,112 @@
-from typing import Any
-from box_print import box_print_title, box_print_body, box_print_footer
+from typing import Any, Iterator
+import numpy as np
+from box_print import BoxRenderer
+from metrics import timed
+
+
+SECONDS_PER_DAY: int = 86400
 
 
 class FiveDayForecastData:
-    """Hanterar och printar fem dagars väderprognosdata i lämpligt format."""
+    """Hanterar och printar fem dagars väderprognosdata i lämpligt format.
+    Prognosdatan tolkas en gång till kompakta kolumner (NumPy-arrayer) istället för att sparas som en lista med dictionaries."""
 
+    @timed("model_construction", model="FiveDayForecastData")
     def __init__(self, weather_data: dict) -> None:
         self.city: str = weather_data["city"]["name"]  # Sparar stadsnamn
-        self.forecast_data: list[Any] = weather_data["list"]  # Sparar en lista med dictionaries på alla tidsprognoser
+        self.timezone: int = weather_data["city"].get("timezone", 0)  # Stadens förskjutning från UTC i sekunder
+        forecast_data: list[Any] = weather_data["list"]  # Lista med dictionaries på alla tidsprognoser
+
+        # Varje väderbeskrivning sparas bara en gång, tidsprognoserna pekar på sin beskrivning med ett index
+        self.descriptions: list[str] = []
+        description_index: dict[str, int] = {}
+        for item in forecast_data:
+            description: str = item["weather"][0]["description"]
+            if description not in description_index:
+                description_index[description] = len(self.descriptions)
+                self.descriptions.append(description)
+
+        # Sparar en kolumn per värde, en rad per tidsprognos
+        self.timestamps: np.ndarray = np.array([item["dt"] for item in forecast_data], dtype=np.int64)  # Unix-tid i UTC
+        self.temperature: np.ndarray = np.array([item["main"]["temp"] for item in forecast_data], dtype=np.float32)
+        self.feels_like: np.ndarray = np.array([item["main"]["feels_like"] for item in forecast_data], dtype=np.float32)
+        self.humidity: np.ndarray = np.array([item["main"]["humidity"] for item in forecast_data], dtype=np.uint8)
+        self.wind_speed: np.ndarray = np.array([item.get("wind", {}).get("speed", np.nan) for item in forecast_data], dtype=np.float32)
+        self.weather_id: np.ndarray = np.array([item["weather"][0]["id"] for item in forecast_data], dtype=np.uint16)
+        self.description_id: np.ndarray = np.array(
+            [description_index[item["weather"][0]["description"]] for item in forecast_data], dtype=np.uint16
+        )
+
+    def __len__(self) -> int:
+        """Returnerar antalet tidsprognoser."""
+        return len(self.timestamps)
 
-    def print_forecast_data(self, width: int) -> None:
+    def local_days(self) -> np.ndarray:
+        """Returnerar lokalt datum för varje tidsprognos som antal dagar sedan 1970-01-01."""
+        return (self.timestamps + self.timezone) // SECONDS_PER_DAY
+
+    def daily_groups(self) -> tuple[np.ndarray, np.ndarray]:
+        """Grupperar tidsprognoserna efter lokalt datum.
+        Returnerar en array med datumen samt en array med indexet där varje datums första tidsprognos börjar."""
+        days, starts = np.unique(self.local_days(), return_index=True)  # Tidsprognoserna är sorterade efter tid
+        return days.astype("datetime64[D]"), starts
+
+    def daily_aggregates(self) -> dict[str, np.ndarray]:
+        """Räknar ut lägsta, högsta och medeltemperatur per lokalt datum."""
+        dates, starts = self.daily_groups()
+        counts: np.ndarray = np.diff(np.append(starts, len(self.timestamps)))
+        return {
+            "date": dates,
+            "temp_min": np.minimum.reduceat(self.temperature, starts),
+            "temp_max": np.maximum.reduceat(self.temperature, starts),
+            "temp_mean": np.add.reduceat(self.temperature, starts) / counts,
+        }
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        """Returnerar en platt dictionary per tidsprognos, en i taget, lämplig för export som NDJSON eller CSV.
+        Tiderna anges i stadens lokala tid."""
+        local_times: np.ndarray = (self.timestamps + self.timezone).astype("datetime64[s]")
+        for index in range(len(self.timestamps)):
+            local_time: str = str(local_times[index])  # Formatet blir YYYY-MM-DDTHH:MM:SS
+            yield {
+                "kind": "forecast",
+                "city": self.city,
+                "timestamp": int(self.timestamps[index]),
+                "date": local_time[:10],
+                "time": local_time[11:16],
+                "temperature": float(np.format_float_positional(self.temperature[index], trim="-")),
+                "feels_like": float(np.format_float_positional(self.feels_like[index], trim="-")),
+                "humidity": int(self.humidity[index]),
+                "wind_speed": None if np.isnan(self.wind_speed[index]) else float(np.format_float_positional(self.wind_speed[index], trim="-")),
+                "weather_id": int(self.weather_id[index]),
+                "description": self.descriptions[self.description_id[index]],
+            }
+
+    @timed("rendering", model="FiveDayForecastData")
+    def print_forecast_data(self, width: int, renderer: BoxRenderer | None = None) -> None:
         """Printar ut all prognosdata för de kommande 120 timmarna tillsammans.
-        Varje datum med dess tidsprognoser blir omgivet av en linjeram med en angiven bredd."""
+        Varje lokalt datum med dess tidsprognoser blir omgivet av en linjeram med en angiven bredd.
+        Om en renderer anges läggs rutorna till i dess buffert, annars skrivs hela prognosen ut med en skrivning."""
+        output: BoxRenderer = renderer if renderer is not None else BoxRenderer()
+
+        dates, starts = self.daily_groups()
+        ends: np.ndarray = np.append(starts[1:], len(self.timestamps))
+        seconds_of_day: np.ndarray = (self.timestamps + self.timezone) % SECONDS_PER_DAY  # Lokal tid på dygnet i sekunder
 
-        seen_dates: list[str] = []  # Lista som ska spara alla datum som loopen har gått genom
+        # Loopar genom varje datum och printar dess tidsprognoser i en egen ruta
+        for date, start, end in zip(dates, starts, ends):
+            output.title(str(date), width)  # Printar datumet, formatet blir YYYY-MM-DD
 
-        # Loopar genom varje värde i den inhämtade prognosdatan
-        for index, item in enumerate(self.forecast_data):
-            # Hämtar in tidsprognosens datum från varje iteration. Datumet i APIn ser ut på detta sätt: "2024-10-01 12:00:00"
-            date: str = item["dt_txt"][0:10]  # Slicear ut datumet från strängen, formatet blir YYYY-MM-DD
-            time: str = item["dt_txt"][11:16]  # Slicear ut tiden från strängen, formatet blir HH:MM
+            for index in range(start, end):
+                hours, minutes = divmod(int(seconds_of_day[index]) // 60, 60)
+                description: str = self.descriptions[self.description_id[index]]
+                temperature: str = np.format_float_positional(self.temperature[index], trim="-")  # Kortaste formen, ex. '23.45' eller '23'
 
-            # Om datumet i iterationen inte har setts tidigare ska datumet printas ut
-            if date not in seen_dates:
-                seen_dates.append(date)  # Registrerar det nya datumet
-                box_print_title(date, width)  # Printar datumet
+                # Skapar en sträng för varje tidsprognos. Exempel på hur strängen kan komma att se ut: '14:00: 23 °C, Klart väder'
+                new_line: str = f"{hours:02d}:{minutes:02d}: {temperature} °C, {description.capitalize()}"
+                output.body(new_line, width)
 
-            # Skapar en sträng för varje tidsprognos. Exempel på hur strängen kan komma att se ut: '14:00: 23 °C, Klart väder'
-            new_line: str = f"{time}: {item['main']['temp']} °C, {item['weather'][0]['description'].capitalize()}"
-            box_print_body(new_line, width)
+            output.footer(width)
 
-            # Om tiden i iterationen är 21:00 eller om det är den sista iterationen ska en footer printas
-            if time == "21:00" or index == len(self.forecast_data) - 1:
-                box_print_footer(width)
+        if renderer is None:
+            output.flush()
@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import threading
+from typing import Iterator, NamedTuple
+
+
+# Miljövariabler med sökvägar till GeoNames-filer, exempelvis cities500.txt och SE.txt från https://download.geonames.org/export/
+CITIES_FILE_VARIABLE: str = "WEATHERAPP_CITIES_FILE"
+POSTAL_CODES_FILE_VARIABLE: str = "WEATHERAPP_POSTAL_CODES_FILE"
+
+# Standardfilen där det indexerade ortregistret sparas, så att GeoNames-filerna bara behöver läsas in en gång
+INDEX_FILE: str = "gazetteer_index.sqlite3"
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS city_names (
+    name TEXT NOT NULL,         -- Normaliserat namn eller alternativt namn, ex. 'göteborg' och 'gothenburg'
+    place_name TEXT NOT NULL,   -- Ortens namn som det skrivs i GeoNames, ex. 'Göteborg'
+    country TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    population INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS city_names_by_name ON city_names (name, population DESC);
+CREATE TABLE IF NOT EXISTS postal_codes (
+    country TEXT NOT NULL,
+    postal_code TEXT NOT NULL,  -- Normaliserat postnummer, ex. '11455'
+    place_name TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    PRIMARY KEY (country, postal_code)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    kind TEXT PRIMARY KEY,      -- 'cities' eller 'postal_codes'
+    path TEXT NOT NULL,         -- GeoNames-filen som indexet byggdes från
+    signature TEXT NOT NULL     -- Filens storlek och ändringstid, så att indexet byggs om när filen ändras
+);
+"""
+
+
+class Place(NamedTuple):
+    """En plats i ortregistret med dess koordinater."""
+
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+    population: int = 0
+
+
+def normalize_name(name: str) -> str:
+    """Normaliserar ett ortnamn så att sökningen inte bryr sig om stora/små bokstäver eller extra mellanslag."""
+    return " ".join(name.casefold().split())
+
+
+def normalize_postal_code(postal_code: str) -> str:
+    """Normaliserar ett postnummer så att '114 55' och '11455' ger samma nyckel."""
+    return "".join(postal_code.upper().split())
+
+
+def file_signature(path: str) -> str:
+    """Returnerar en signatur av filens storlek och ändringstid, som ändras när filen byts ut."""
+    stat: os.stat_result = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class Gazetteer:
+    """Ett lokalt ortregister som slår upp stadsnamn och postnummer till koordinater utan nätverksanrop.
+    Läses in från filer i GeoNames-format (tabbseparerade) till ett SQLite-index för exakt sökning och prefixsökning.
+    Filer som anges när registret skapas indexeras vid den första sökningen som behöver dem. Med ett index på disk
+    återanvänds det av senare körningar så länge filerna är oförändrade, så att programmet startar snabbt även med stora filer."""
+
+    def __init__(self, path: str = ":memory:", cities_file: str | None = None, postal_codes_file: str | None = None) -> None:
+        self.path: str = path  # Sökväg till indexet, ':memory:' håller det bara i minnet
+        self._pending: dict[str, str] = {}  # Posttyp -> GeoNames-fil som ännu inte har kontrollerats mot indexet
+        if cities_file:
+            self._pending["cities"] = cities_file
+        if postal_codes_file:
+            self._pending["postal_codes"] = postal_codes_file
+        self._loaded: bool = False  # Om orter eller postnummer har lästs in med load_cities() eller load_postal_codes()
+        self._lock: threading.RLock = threading.RLock()
+        self._connection: sqlite3.Connection | None = None  # Öppnas vid första användningen
+
+    def __bool__(self) -> bool:
+        """Ett ortregister utan inlästa eller väntande filer räknas som tomt."""
+        return bool(self._loaded or self._pending)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returnerar anslutningen till indexet och öppnar den om det behövs. Anropas med låset hållet."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _ensure(self, kind: str) -> None:
+        """Ser till att den väntande filen för posttypen finns i indexet. Indexet byggs bara om filen är ny eller har ändrats."""
+        if kind not in self._pending:
+            return
+        with self._lock:
+            path: str | None = self._pending.pop(kind, None)
+            if path is None:
+                return
+            connection: sqlite3.Connection = self._connect()
+            signature: str = file_signature(path)
+            row: tuple[str, str] | None = connection.execute("SELECT path, signature FROM sources WHERE kind = ?", (kind,)).fetchone()
+            if row != (os.path.abspath(path), signature):
+                with connection:
+                    connection.execute(f"DELETE FROM {'city_names' if kind == 'cities' else 'postal_codes'}")
+                if kind == "cities":
+                    self.load_cities(path)
+                else:
+                    self.load_postal_codes(path)
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (kind, os.path.abspath(path), signature))
+            self._loaded = True
+
+    def load_cities(self, path: str) -> None:
+        """Läser in orter från en GeoNames-fil som cities500.txt.
+        Kolumnerna som används är namn (1), ASCII-namn (2), alternativa namn (3), latitud (4), longitud (5), landskod (8) och befolkning (14)."""
+
+        def rows() -> Iterator[tuple[str, str, str, float, float, int]]:
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    columns: list[str] = line.rstrip("\n").split("\t")
+                    if len(columns) < 15:
+                        continue
+                    place: tuple[str, str, float, float, int] = (columns[1], columns[8], float(columns[4]), float(columns[5]), int(columns[14] or 0))
+                    names: set[str] = {normalize_name(columns[1]), normalize_name(columns[2])}
+                    names.update(normalize_name(name) for name in columns[3].split(",") if name)
+                    for name in names:
+                        yield (name, *place)
+
+        with self._lock:
+            connection: sqlite3.Connection = self._connect()
+            with connection:
+                connection.executemany("INSERT INTO city_names VALUES (?, ?, ?, ?, ?, ?)", rows())
+            self._loaded = True
+
+    def load_postal_codes(self, path: str) -> None:
+        """Läser in postnummer från en GeoNames-fil som SE.txt eller allCountries.txt.
+        Kolumnerna som används är landskod (0), postnummer (1), ortnamn (2), latitud (9) och longitud (10)."""
+
+        def rows() -> Iterator[tuple[str, str, str, float, float]]:
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    columns: list[str] = line.rstrip("\n").split("\t")
+                    if len(columns) < 11 or not columns[9] or not columns[10]:
+                        continue
+                    yield columns[0].upper(), normalize_postal_code(columns[1]), columns[2], float(columns[9]), float(columns[10])
+
+        with self._lock:
+            connection: sqlite3.Connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO postal_codes VALUES (?, ?, ?, ?, ?)", rows())
+            self._loaded = True
+
+    def lookup_city(self, name: str, country: str | None = None) -> Place | None:
+        """Returnerar orten med exakt det namnet (och landskoden, om den anges) med störst befolkning, eller None."""
+        self._ensure("cities")
+        if not self:
+            return None
+        query: str = "SELECT place_name, country, latitude, longitude, population FROM city_names WHERE name = ?"
+        params: tuple[str, ...] = (normalize_name(name),)
+        if country is not None:
+            query += " AND country = ?"
+            params += (country.upper(),)
+        with self._lock:
+            row: tuple[str, str, float, float, int] | None = self._connect().execute(f"{query} ORDER BY population DESC LIMIT 1", params).fetchone()
+        return Place(*row) if row is not None else None
+
+    def lookup_postal_code(self, postal_code: str, country: str) -> Place | None:
+        """Returnerar orten för ett postnummer i ett land, eller None om postnumret inte finns i registret."""
+        self._ensure("postal_codes")
+        if not self:
+            return None
+        with self._lock:
+            row: tuple[str, str, float, float] | None = self._connect().execute(
+                "SELECT place_name, country, latitude, longitude FROM postal_codes WHERE country = ? AND postal_code = ?",
+                (country.upper(), normalize_postal_code(postal_code)),
+            ).fetchone()
+        return Place(*row) if row is not None else None
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> list[Place]:
+        """Returnerar orter vars namn (eller alternativa namn) börjar med prefixet, sorterade efter namn."""
+        self._ensure("cities")
+        if not self:
+            return []
+        normalized: str = normalize_name(prefix)
+        matches: list[Place] = []
+        previous_name: str | None = None
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT name, place_name, country, latitude, longitude, population FROM city_names WHERE name >= ? ORDER BY name, population DESC",
+                (normalized,),
+            )
+            for name, *place in rows:
+                if not name.startswith(normalized) or len(matches) >= limit:
+                    break
+                if name == previous_name:
+                    continue  # Bara orten med störst befolkning räknas för varje namn
+                previous_name = name
+                if Place(*place) not in matches:  # Samma ort kan ha flera namn som börjar med prefixet
+                    matches.append(Place(*place))
+        return matches
+
+    def close(self) -> None:
+        """Stänger anslutningen till indexet."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_default_gazetteer: Gazetteer | None = None
+
+
+def default_gazetteer() -> Gazetteer:
+    """Returnerar det ortregister som delas av hela programmet, med filerna som miljövariablerna pekar på.
+    Filerna indexeras till INDEX_FILE vid den första sökningen och indexet återanvänds av senare körningar.
+    Om inga filer har angetts blir registret tomt och sökningar skickas som fritext till API:et som tidigare."""
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        cities_file: str | None = os.environ.get(CITIES_FILE_VARIABLE) or None
+        postal_codes_file: str | None = os.environ.get(POSTAL_CODES_FILE_VARIABLE) or None
+        path: str = INDEX_FILE if cities_file or postal_codes_file else ":memory:"
+        _default_gazetteer = Gazetteer(path, cities_file, postal_codes_file)
+    return _default_gazetteer
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+from datetime import date as Date, timedelta
+from typing import Any, Iterator
+
+
+# Standardfilen där arkivet sparas
+ARCHIVE_FILE: str = "historical_archive.sqlite3"
+
+# Antal dagar som läses från arkivet åt gången
+ARCHIVE_PAGE_SIZE: int = 500
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS locations (
+    location TEXT PRIMARY KEY,  -- Normaliserat sökord, ex. 'stockholm'
+    query TEXT NOT NULL         -- Platsen som WorldWeatherOnline tolkade sökningen som, ex. 'Stockholm, Sweden'
+);
+CREATE TABLE IF NOT EXISTS days (
+    location TEXT NOT NULL,
+    date TEXT NOT NULL,         -- YYYY-MM-DD
+    max_temp REAL,
+    min_temp REAL,
+    avg_temp REAL,
+    sun_hours REAL,
+    day_json TEXT NOT NULL,     -- Hela dagens data från API:et
+    PRIMARY KEY (location, date)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_location(city: str) -> str:
+    """Normaliserar ett platsnamn så att ' Stockholm' och 'stockholm' hamnar under samma nyckel i arkivet."""
+    return " ".join(city.lower().split())
+
+
+def _to_float(value: Any) -> float | None:
+    """Gör om ett värde från API:et (som oftast är en sträng) till ett flyttal, eller None om det saknas."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class HistoricalArchive:
+    """Ett lokalt arkiv på disk (SQLite) med all historisk väderdata som har hämtats, indexerat på plats och datum.
+    Eftersom historisk data aldrig förändras behöver varje dag bara hämtas från API:et en gång."""
+
+    def __init__(self, path: str = ARCHIVE_FILE) -> None:
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        self._connection: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def store(self, city: str, response: dict) -> None:
+        """Sparar alla dagar i ett API-svar från WorldWeatherOnline under den normaliserade platsen."""
+        location: str = normalize_location(city)
+        query: str = response["data"]["request"][0]["query"]
+        rows: list[tuple[Any, ...]] = [
+            (
+                location,
+                day["date"],
+                _to_float(day.get("maxtempC")),
+                _to_float(day.get("mintempC")),
+                _to_float(day.get("avgtempC")),
+                _to_float(day.get("sunHour")),
+                json.dumps(day, separators=(",", ":")),
+            )
+            for day in response["data"]["weather"]
+        ]
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO locations VALUES (?, ?)", (location, query))
+            self._connection.executemany("INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def missing_dates(self, city: str, start_date: Date, end_date: Date) -> list[Date]:
+        """Returnerar de datum i intervallet som ännu inte finns i arkivet."""
+        with self._lock:
+            stored: set[str] = {
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT date FROM days WHERE location = ? AND date BETWEEN ? AND ?",
+                    (normalize_location(city), start_date.isoformat(), end_date.isoformat()),
+                )
+            }
+        days: int = (end_date - start_date).days + 1
+        return [day for day in (start_date + timedelta(days=offset) for offset in range(days)) if day.isoformat() not in stored]
+
+    def iter_days(self, city: str, start_date: Date, end_date: Date) -> Iterator[dict]:
+        """Returnerar arkiverade dagar i datumordning, en i taget, utan att läsa in hela intervallet i minnet.
+        Dagarna läses sida för sida så att låset inte hålls medan anroparen bearbetar dem."""
+        location: str = normalize_location(city)
+        last_date: str = ""  # Datumet för den senast lästa dagen, nästa sida börjar efter det
+        while True:
+            with self._lock:
+                rows: list[tuple[str, str]] = self._connection.execute(
+                    "SELECT date, day_json FROM days WHERE location = ? AND date BETWEEN ? AND ? AND date > ? ORDER BY date LIMIT ?",
+                    (location, start_date.isoformat(), end_date.isoformat(), last_date, ARCHIVE_PAGE_SIZE),
+                ).fetchall()
+            for last_date, day_json in rows:
+                yield json.loads(day_json)
+            if len(rows) < ARCHIVE_PAGE_SIZE:
+                return
+
+    def query_for(self, city: str) -> str | None:
+        """Returnerar platsen som WorldWeatherOnline tolkade sökningen som, eller None om platsen inte finns i arkivet."""
+        with self._lock:
+            row: tuple[str] | None = self._connection.execute(
+                "SELECT query FROM locations WHERE location = ?", (normalize_location(city),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def load(self, city: str, start_date: Date, end_date: Date) -> dict | None:
+        """Returnerar arkiverade dagar i samma format som ett API-svar, så att det kan användas direkt av HistoricalData.
+        Returnerar None om platsen inte finns i arkivet."""
+        query: str | None = self.query_for(city)
+        if query is None:
+            return None
+        return {"data": {"request": [{"type": "City", "query": query}], "weather": list(self.iter_days(city, start_date, end_date))}}
+
+    def mean_max_temp_by_year(self, city: str, month: int) -> dict[int, float]:
+        """Räknar ut medelvärdet av dagarnas högsta temperatur för en viss månad, år för år, helt utan nätverksanrop."""
+        with self._lock:
+            rows: list[tuple[str, float]] = self._connection.execute(
+                "SELECT substr(date, 1, 4), AVG(max_temp) FROM days "
+                "WHERE location = ? AND substr(date, 6, 2) = ? GROUP BY substr(date, 1, 4) ORDER BY 1",
+                (normalize_location(city), f"{month:02d}"),
+            ).fetchall()
+        return {int(year): mean for year, mean in rows}
+
+    def close(self) -> None:
+        """Stänger anslutningen till arkivet."""
+        with self._lock:
+            self._connection.close()
+
+
+_default_archive: HistoricalArchive | None = None
+
+
+def default_archive() -> HistoricalArchive:
+    """Returnerar det arkiv som delas av alla managers i programmet."""
+    global _default_archive
+    if _default_archive is None:
+        _default_archive = HistoricalArchive()
+    return _default_archive
@@ -1,61 +1,169 @@
-import requests
-import pyinputplus as pyip
-from box_print import box_print_title, box_print_body, box_print_footer
-from typing import Any
-
-
-class HistoricalData:
-    def __init__(self, data) -> None:
-        self.data: dict = data
-        self.query: str = self.data["data"]["request"][0]["query"]  # Hämtar vad för stad samt land som datan representerar
-        self.date: str = self.data["data"]["weather"][0]["date"]  # Hämtar datum
-        self.sun_hours: str = self.data["data"]["weather"][0]["sunHour"]  # Hämtar totala soltimmar
-        self.max_temp: str = self.data["data"]["weather"][0]["mintempC"]  # Hämtar max temperatur
-        self.min_temp: str = self.data["data"]["weather"][0]["mintempC"]  # Hämtar lägst temperatur
-
-    def print_historical_data(self) -> None:
-        """Skriver ut all historisk väderdata som hämtats."""
-        border_width: int = 40
-        print("\nHere is the data you requested:\n")
-        box_print_title(f"{self.query}", border_width)
-        box_print_body(f"Date: {self.date}", border_width)
-        box_print_body(f"Highest temperature: {self.max_temp}°C", border_width)
-        box_print_body(f"Lowest temperature: {self.min_temp}°C", border_width)
-        box_print_body(f"Total sun hours: {int(float(self.sun_hours))}h", border_width)
-        box_print_footer(border_width)
-
-
-class HistoricalManager:
-    def __init__(self, api_key: str) -> None:
-        self.api_key: str = api_key
-
-    def get_historical_data(self) -> Any:
-        attempt_search = True
-        while attempt_search:  # Loop för att kunna söka efter flera städer utan att programmet avslutas
-            try:
-                city: str = input("\nAnge stad: ")
-                date: str = pyip.inputDate(
-                    prompt="\nAnge datum som du vill ha historisk väderdata på.\n"
-                    "OBS: tidigaste godtagbara datumet är 2008/07/01.\n"
-                    "Formatet måste vara i YYYY/MM/DD: "
-                )
-                result = self.fetch_historical_data(
-                    city, date
-                )  # Tar input från användaren och skickar upp det till metoden för att kunna skapa API-länken
-                return result
-            except Exception as e:  # Ifall det inte skulle gå att hämta data som förväntat så kommer denna utskrift att köras.
-                print(
-                    f"\nEtt fel uppstod när historiska datan skulle hämtas. Vänligen kontrollera att du har en internetanslutning!\nFelmeddelande: {e}"
-                )
-                if pyip.inputYesNo("\nVill du försöka igen? (y/n): ") == "no":
-                    print("Tack för att du använder vår väderapp. Hejdå!")
-                    attempt_search = False
-
-    def fetch_historical_data(self, city: str, date: str) -> Any:
-        historical_url: str = "http://api.worldweatheronline.com/premium/v1/past-weather.ashx?key={}&format=json&q={}&date={}".format(
-            self.api_key, city, date
-        )  # Hela API länken
-        response: requests.Response = requests.get(historical_url)  # Hämtar API länk och tilldelar den till en variabel
-
-        historical_weather_data = response.json()  # Formaterar om hämtningen till json fil
-        return historical_weather_data
+import os
+from box_print import BoxRenderer
+from typing import Any, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as Date
+from metrics import metrics, timed
+from historical_archive import HistoricalArchive, default_archive
+from response_cache import encode_query
+
+# pyinputplus och requests (via http_transport) importeras först i de metoder som använder dem, så att programmet startar snabbt
+if TYPE_CHECKING:
+    from requests import Response
+    from http_transport import HttpTransport
+
+
+# URL till WorldWeatherOnlines API för historiskt väder. Kan bytas ut med miljövariabeln WEATHERAPP_WWO_URL, exempelvis mot en lokal testserver.
+WORLDWEATHERONLINE_URL: str = os.environ.get("WEATHERAPP_WWO_URL", "http://api.worldweatheronline.com/premium/v1/past-weather.ashx")
+
+
+def to_date(value: Date | str) -> Date:
+    """Gör om ett datum i formatet YYYY/MM/DD eller YYYY-MM-DD till ett date-objekt."""
+    if isinstance(value, Date):
+        return value
+    return Date.fromisoformat(value.strip().replace("/", "-"))
+
+
+def group_by_month(dates: list[Date]) -> list[tuple[Date, Date]]:
+    """Grupperar datum i delintervall som vart och ett ligger inom en och samma kalendermånad,
+    eftersom WorldWeatherOnline bara returnerar en månad per förfrågan med parametern 'enddate'.
+    Varje delintervall sträcker sig från månadens första till sista datum i listan, så att de hämtas med så få förfrågningar som möjligt."""
+
+    chunks: dict[tuple[int, int], tuple[Date, Date]] = {}
+    for day in sorted(dates):
+        month: tuple[int, int] = (day.year, day.month)
+        chunks[month] = (chunks[month][0], day) if month in chunks else (day, day)
+    return list(chunks.values())
+
+
+def historical_day_record(query: str, day: dict) -> dict[str, Any]:
+    """Returnerar en historisk dag som en platt dictionary, lämplig för export som NDJSON eller CSV."""
+    return {
+        "kind": "historical",
+        "query": query,
+        "date": day["date"],
+        "max_temp": day.get("maxtempC"),
+        "min_temp": day.get("mintempC"),
+        "avg_temp": day.get("avgtempC"),
+        "sun_hours": day.get("sunHour"),
+    }
+
+
+class HistoricalData:
+    @timed("model_construction", model="HistoricalData")
+    def __init__(self, data) -> None:
+        self.data: dict = data
+        self.query: str = self.data["data"]["request"][0]["query"]  # Hämtar vad för stad samt land som datan representerar
+        self.days: list[Any] = self.data["data"]["weather"]  # Sparar alla hämtade dagar
+        self.date: str = self.days[0]["date"]  # Hämtar datum
+        self.sun_hours: str = self.days[0]["sunHour"]  # Hämtar totala soltimmar
+        self.max_temp: str = self.days[0]["maxtempC"]  # Hämtar max temperatur
+        self.min_temp: str = self.days[0]["mintempC"]  # Hämtar lägst temperatur
+
+    @timed("rendering", model="HistoricalData")
+    def print_historical_data(self, renderer: BoxRenderer | None = None) -> None:
+        """Skriver ut all historisk väderdata som hämtats, en ruta per dag.
+        Om en renderer anges läggs rutorna till i dess buffert, annars skrivs allt ut med en skrivning."""
+        border_width: int = 40
+        output: BoxRenderer = renderer if renderer is not None else BoxRenderer()
+        output.line("\nHere is the data you requested:\n")
+        for day in self.days:
+            output.title(f"{self.query}", border_width)
+            output.body(f"Date: {day['date']}", border_width)
+            output.body(f"Highest temperature: {day['maxtempC']}°C", border_width)
+            output.body(f"Lowest temperature: {day['mintempC']}°C", border_width)
+            output.body(f"Total sun hours: {int(float(day['sunHour']))}h", border_width)
+            output.footer(border_width)
+
+        if renderer is None:
+            output.flush()
+
+
+class HistoricalManager:
+    def __init__(
+        self,
+        api_key: str,
+        transport: "HttpTransport | None" = None,
+        archive: HistoricalArchive | None = None,
+        base_url: str = WORLDWEATHERONLINE_URL,
+    ) -> None:
+        self.api_key: str = api_key
+        self.base_url: str = base_url  # URL till API:et för historiskt väder
+        self.archive: HistoricalArchive = archive if archive is not None else default_archive()  # Lokalt arkiv med hämtade dagar
+        self._transport: "HttpTransport | None" = transport  # Delad HTTP-anslutningspool, skapas vid första anropet om ingen angetts
+
+    @property
+    def transport(self) -> "HttpTransport":
+        """Returnerar HTTP-transporten. Den delade transporten skapas (och requests importeras) först när den behövs."""
+        if self._transport is None:
+            from http_transport import default_transport
+
+            self._transport = default_transport()
+        return self._transport
+
+    def get_historical_data(self) -> Any:
+        import pyinputplus as pyip
+
+        attempt_search = True
+        while attempt_search:  # Loop för att kunna söka efter flera städer utan att programmet avslutas
+            try:
+                city: str = input("\nAnge stad: ")
+                date: str = pyip.inputDate(
+                    prompt="\nAnge datum som du vill ha historisk väderdata på.\n"
+                    "OBS: tidigaste godtagbara datumet är 2008/07/01.\n"
+                    "Formatet måste vara i YYYY/MM/DD: "
+                )
+                end_date: Any = pyip.inputDate(
+                    prompt="\nAnge slutdatum om du vill ha ett datumintervall, eller lämna tomt för ett enda datum.\n"
+                    "Formatet måste vara i YYYY/MM/DD: ",
+                    blank=True,
+                )
+                # Hämtar alla dagar mellan datumen, eller bara startdatumet om inget slutdatum angavs.
+                # Dagar som redan finns i arkivet hämtas inte från API:et igen.
+                result = self.fetch_historical_range(city, date, end_date or date)
+                return result
+            except Exception as e:  # Ifall det inte skulle gå att hämta data som förväntat så kommer denna utskrift att köras.
+                print(
+                    f"\nEtt fel uppstod när historiska datan skulle hämtas. Vänligen kontrollera att du har en internetanslutning!\nFelmeddelande: {e}"
+                )
+                if pyip.inputYesNo("\nVill du försöka igen? (y/n): ") == "no":
+                    print("Tack för att du använder vår väderapp. Hejdå!")
+                    attempt_search = False
+
+    def fetch_historical_data(self, city: str, date: Date | str, end_date: Date | str | None = None) -> Any:
+        # Svaren sparas inte i svarscachen. De hämtade dagarna sparas istället i arkivet av fetch_historical_range.
+        with metrics.timer("url_build"):
+            # Hela API länken. Med enddate hämtas alla dagar fram till och med slutdatumet (inom samma månad).
+            # Värdena URL-kodas så att staden inte kan lägga till eller byta ut parametrar, exempelvis API-nyckeln.
+            params: dict[str, Any] = {"key": self.api_key, "format": "json", "q": city, "date": date, "enddate": end_date}
+            historical_url: str = f"{self.base_url}?{encode_query(params)}"
+
+        with metrics.timer("http_fetch", api="worldweatheronline"):
+            response: "Response" = self.transport.get(historical_url)  # Hämtar API länk och tilldelar den till en variabel
+
+        with metrics.timer("json_decode", api="worldweatheronline"):
+            historical_weather_data = response.json()  # Formaterar om hämtningen till json fil
+
+        return historical_weather_data
+
+    def fetch_historical_range(self, city: str, start_date: Date | str, end_date: Date | str, max_workers: int = 6) -> dict:
+        """Hämtar historisk väderdata för alla dagar mellan start- och slutdatumet.
+        Dagar som redan finns i arkivet läses därifrån. Saknade dagar grupperas per månad, hämtas parallellt
+        och sparas i arkivet, varefter hela intervallet returneras i datumordning som ett enda svar."""
+
+        start: Date = to_date(start_date)
+        end: Date = to_date(end_date)
+        if end < start:
+            raise ValueError("Slutdatumet måste vara samma som eller efter startdatumet.")
+
+        chunks: list[tuple[Date, Date]] = group_by_month(self.archive.missing_dates(city, start, end))
+        if chunks:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                responses: list[Any] = list(executor.map(lambda chunk: self.fetch_historical_data(city, chunk[0], chunk[1]), chunks))
+
+            for response in responses:
+                if "error" in response.get("data", {}):
+                    raise ValueError(response["data"]["error"][0]["msg"])
+                self.archive.store(city, response)
+
+        return self.archive.load(city, start, end)
@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+from upstream_scheduler import UpstreamScheduler, default_scheduler
+
+
+# Statuskoder som betyder att servern är tillfälligt överbelastad och att förfrågan kan göras om
+RETRY_STATUS_CODES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+
+class RetryingSession(requests.Session):
+    """En requests.Session som gör om misslyckade förfrågningar med exponentiell backoff och slumpmässig jitter.
+    Eftersom geocoder tar emot en session som argument får även dess anrop samma återförsök och återanvända anslutningar."""
+
+    def __init__(self, transport: "HttpTransport") -> None:
+        super().__init__()
+        self.transport: HttpTransport = transport
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:  # type: ignore[override]
+        """Skickar förfrågan och försöker igen vid 429/5xx eller anslutningsfel, upp till transportens max antal försök.
+        Varje försök väntar först på sin tur hos schemaläggaren så att API-nycklarnas gränser hålls."""
+        kwargs.setdefault("timeout", self.transport.timeout)  # Använder transportens timeout om ingen annan angetts
+
+        attempt: int = 0
+        while True:
+            self.transport.scheduler.acquire(url)
+            try:
+                response: requests.Response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.increment("upstream_errors", reason=type(e).__name__)
+                if attempt >= self.transport.max_retries:
+                    raise
+                self.transport.sleep_before_retry(attempt, None)
+                attempt += 1
+                continue
+
+            if response.status_code >= 400:
+                metrics.increment("upstream_errors", reason=response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.transport.max_retries:
+                return response
+
+            retry_after: float | None = self.transport.parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and retry_after > self.transport.backoff_max:
+                return response  # Servern vill att vi väntar längre än vad som är rimligt här, så felet lämnas till anroparen
+            response.close()  # Lämnar tillbaka anslutningen till poolen innan nästa försök
+            self.transport.sleep_before_retry(attempt, retry_after)
+            attempt += 1
+
+
+class HttpTransport:
+    """Gemensam HTTP-transport för alla anrop mot OpenWeatherMap, WorldWeatherOnline och geocoder.
+    Håller en pool med keep-alive-anslutningar per värd så att TCP- och TLS-handskakningar kan återanvändas."""
+
+    def __init__(
+        self,
+        timeout: float | tuple[float, float] = (3.05, 10),
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        pool_maxsize: int = 10,
+        scheduler: UpstreamScheduler | None = None,
+    ) -> None:
+        self.timeout: float | tuple[float, float] = timeout  # (anslutningstimeout, lästimeout) i sekunder
+        self.max_retries: int = max_retries  # Antal återförsök efter det första försöket
+        self.backoff_base: float = backoff_base  # Väntetid i sekunder inför första återförsöket
+        self.backoff_max: float = backoff_max  # Längsta tillåtna väntetid mellan två försök
+        self.retries: int = 0  # Antal återförsök som har gjorts totalt
+        self.scheduler: UpstreamScheduler = scheduler if scheduler is not None else default_scheduler()  # Håller API-nycklarnas gränser
+        self._lock: threading.Lock = threading.Lock()
+
+        self.adapter: HTTPAdapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize)
+        self.session: RetryingSession = RetryingSession(self)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """Skickar en GET-förfrågan genom den delade sessionen."""
+        return self.session.get(url, **kwargs)
+
+    def sleep_before_retry(self, attempt: int, retry_after: float | None) -> None:
+        """Väntar inför ett återförsök. Följer serverns Retry-After (i sekunder) om den finns, annars exponentiell backoff med full jitter."""
+        delay: float = retry_after if retry_after is not None else random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        with self._lock:
+            self.retries += 1
+        time.sleep(delay)
+
+    @staticmethod
+    def parse_retry_after(retry_after: str | None) -> float | None:
+        """Tolkar Retry-After som antingen ett antal sekunder eller ett HTTP-datum. Returnerar None om värdet saknas eller är ogiltigt."""
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def connection_stats(self) -> dict[str, int]:
+        """Returnerar statistik över hur många förfrågningar som har skickats och hur många nya anslutningar som behövdes.
+        Skillnaden är antalet handskakningar som sparades genom att anslutningar återanvändes."""
+        pools: Any = self.adapter.poolmanager.pools
+        requests_sent: int = 0
+        connections_opened: int = 0
+        for key in pools.keys():
+            pool: Any = pools[key]
+            requests_sent += pool.num_requests
+            connections_opened += pool.num_connections
+
+        return {
+            "requests": requests_sent,
+            "connections": connections_opened,
+            "handshakes_saved": requests_sent - connections_opened,
+            "retries": self.retries,
+        }
+
+
+_default_transport: HttpTransport | None = None
+_default_transport_lock: threading.Lock = threading.Lock()
+
+
+def default_transport() -> HttpTransport:
+    """Returnerar den transport som delas av alla managers i programmet."""
+    global _default_transport
+    with _default_transport_lock:  # Transporten kan skapas första gången från flera trådar samtidigt
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+    return _default_transport
@@ -1,9 +1,15 @@
+import time
+
+# Tidpunkten då programmet började läsas in, används av --startup-time för att mäta uppstartstiden
+STARTUP_BEGIN: float = time.perf_counter()
+
+# historical_data och five_day_forecast_data (som drar in numpy) importeras först i de grenar av main() som använder dem
 from weather_manager import WeatherManager
-from historical_data import HistoricalData, HistoricalManager
 from current_weather_data import CurrentWeatherData
-from five_day_forecast_data import FiveDayForecastData
 import logo
 import logging
+import sys
+from metrics import write_if_enabled
 from typing import Any
 
 
@@ -25,6 +31,8 @@ def main() -> None:
 
     # Om användaren har valt att få historisk väderinformation körs koden nedan
     if forecast_type == "Historisk Väderinformation":
+        from historical_data import HistoricalData, HistoricalManager
+
         while True:
             # Skapar en instans av historical manager
             history: HistoricalManager = HistoricalManager(WORLDWEATHERONLINE_API_KEY)
@@ -56,6 +64,8 @@ def main() -> None:
 
             # Om användaren ska ha en 5-dagars prognos körs kodblocket nedan.
             else:
+                from five_day_forecast_data import FiveDayForecastData
+
                 five_day_forecast: FiveDayForecastData = FiveDayForecastData(data)  # Skapar ett objekt för fem dagars väderprognos.
                 five_day_forecast.print_forecast_data(width=40)  # Printar fem dagars prognosen.
         except Exception:
@@ -63,5 +73,43 @@ def main() -> None:
             print("\nKunde inte hämta väderinformation. Kontrollera att stavningen är korrekt eller att postnumret är rätt formaterat!\n")
 
 
+# Moduler som tar lång tid att importera och som inte ska behövas för en cachad sökning
+HEAVY_MODULES: tuple[str, ...] = ("requests", "geocoder", "pyinputplus", "numpy")
+
+
+def measure_startup(city: str, budget_ms: float) -> int:
+    """Mäter uppstartstiden för en sökning på nuvarande väder, från att programmet började läsas in tills svaret är utskrivet.
+    Returnerar 1 om tiden överskrider budgeten, annars 0, så att läget kan användas i skript och cron-jobb."""
+
+    imports_done: float = time.perf_counter()
+    weather: WeatherManager = WeatherManager(OPENWEATHERMAP_API_KEY)
+    data: Any = weather.request_data("weather?", weather.city_search_params(city))
+    CurrentWeatherData(data).print_weather(width=40)
+    done: float = time.perf_counter()
+
+    import_ms: float = (imports_done - STARTUP_BEGIN) * 1000
+    total_ms: float = (done - STARTUP_BEGIN) * 1000
+    loaded: list[str] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    print(f"\nImporter: {import_ms:.1f} ms")
+    print(f"Sökning och utskrift: {total_ms - import_ms:.1f} ms")
+    print(f"Totalt: {total_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+    print(f"Tunga moduler som lästes in: {', '.join(loaded) if loaded else 'inga'}")
+    return 0 if total_ms <= budget_ms else 1
+
+
 if __name__ == "__main__":
-    main()
+    if "--startup-time" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Mäter uppstartstiden för en sökning på nuvarande väder.")
+        parser.add_argument("--startup-time", action="store_true", help="Kör mätningen istället för de interaktiva menyerna.")
+        parser.add_argument("--city", default="Stockholm", help="Stad att söka på. Bör finnas i cachen för att mäta en cachad sökning.")
+        parser.add_argument("--budget-ms", type=float, default=150.0, help="Maximal tillåten uppstartstid i millisekunder.")
+        args = parser.parse_args()
+        sys.exit(measure_startup(args.city, args.budget_ms))
+
+    try:
+        main()
+    finally:
+        write_if_enabled()  # Sparar mätvärdena om de är påslagna (WEATHERAPP_METRICS=1)
@@ -0,0 +1,181 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager
+
+
+# Sätt WEATHERAPP_METRICS=1 för att slå på mätningarna. Avstängda kostar de bara en kontroll av en flagga per anrop.
+METRICS_VARIABLE: str = "WEATHERAPP_METRICS"
+# Filen som mätvärdena sparas till när programmet avslutas. Filer som slutar på '.prom' sparas i Prometheus-format.
+METRICS_FILE_VARIABLE: str = "WEATHERAPP_METRICS_FILE"
+
+# Övre gränser i sekunder för histogrammens hinkar
+BUCKETS: tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_TIMER: ContextManager[None] = nullcontext()  # Återanvänds när mätningarna är avstängda
+
+LabelKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _label_key(name: str, labels: dict[str, Any]) -> LabelKey:
+    """Skapar en nyckel av ett mätvärdes namn och dess etiketter."""
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    """Formaterar etiketter i Prometheus-format, exempelvis '{phase="http_fetch"}'."""
+    parts: list[str] = [f'{label}="{value}"' for label, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Räknar hur många mätningar som hamnat i varje tidsintervall samt summan och antalet mätningar."""
+
+    def __init__(self) -> None:
+        self.bucket_counts: list[int] = [0] * len(BUCKETS)
+        self.count: int = 0
+        self.total: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Registrerar en mätning."""
+        self.count += 1
+        self.total += seconds
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+
+class _Timer:
+    """Mäter tiden för ett kodblock och registrerar den i ett histogram när blocket är klart."""
+
+    def __init__(self, metrics: "Metrics", key: LabelKey) -> None:
+        self.metrics: Metrics = metrics
+        self.key: LabelKey = key
+        self.start: float = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.metrics.observe(self.key, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Samlar in latens per fas (histogram) samt räknare för cacheträffar, cachemissar och fel mot API:erna.
+    Kan exporteras som JSON eller i Prometheus textformat."""
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled: bool = enabled
+        self._histograms: dict[LabelKey, Histogram] = {}
+        self._counters: dict[LabelKey, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def timer(self, phase: str, **labels: Any) -> ContextManager[None]:
+        """Returnerar en context manager som mäter tiden för fasen, exempelvis 'with metrics.timer("http_fetch"):'."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, _label_key(phase, labels))
+
+    def observe(self, key: LabelKey, seconds: float) -> None:
+        """Registrerar en tidsmätning för en fas."""
+        with self._lock:
+            histogram: Histogram | None = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1, **labels: Any) -> None:
+        """Ökar en räknare, exempelvis 'cache_hits' eller 'upstream_errors'."""
+        if not self.enabled:
+            return
+        key: LabelKey = _label_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self) -> None:
+        """Nollställer alla mätvärden."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returnerar alla mätvärden som en dictionary som kan sparas som JSON."""
+        with self._lock:
+            return {
+                "histograms": [
+                    {
+                        "phase": name,
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "sum": histogram.total,
+                        "buckets": dict(zip(map(str, BUCKETS), histogram.bucket_counts)),
+                    }
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self._counters.items()],
+            }
+
+    def to_json(self) -> str:
+        """Returnerar alla mätvärden som en JSON-sträng."""
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Returnerar alla mätvärden i Prometheus textformat."""
+        lines: list[str] = ["# TYPE weatherapp_phase_seconds histogram"]
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                phase_labels: tuple[tuple[str, str], ...] = (("phase", name),) + labels
+                cumulative: int = 0
+                for bound, bucket_count in zip(BUCKETS, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels: str = _format_labels(phase_labels, f'le="{bound}"')
+                    lines.append(f"weatherapp_phase_seconds_bucket{bucket_labels} {cumulative}")
+                inf_labels: str = _format_labels(phase_labels, 'le="+Inf"')
+                lines.append(f"weatherapp_phase_seconds_bucket{inf_labels} {histogram.count}")
+                lines.append(f"weatherapp_phase_seconds_sum{_format_labels(phase_labels)} {histogram.total}")
+                lines.append(f"weatherapp_phase_seconds_count{_format_labels(phase_labels)} {histogram.count}")
+
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE weatherapp_{name}_total counter")
+                for (counter_name, labels), value in self._counters.items():
+                    if counter_name == name:
+                        lines.append(f"weatherapp_{name}_total{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Sparar mätvärdena till en fil. Filer som slutar på '.prom' får Prometheus textformat, övriga JSON."""
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+# Mätvärdena som delas av hela programmet
+metrics: Metrics = Metrics(enabled=os.environ.get(METRICS_VARIABLE) == "1")
+
+
+def write_if_enabled() -> None:
+    """Sparar de delade mätvärdena till filen i WEATHERAPP_METRICS_FILE (standard 'metrics.json') om mätningarna är påslagna.
+    Anropas när ett kommando avslutas, så att alla kommandon kan exportera sina mätvärden."""
+    if metrics.enabled:
+        metrics.write(os.environ.get(METRICS_FILE_VARIABLE, "metrics.json"))
+
+
+def timed(phase: str, **labels: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Dekorator som mäter tiden för varje anrop av funktionen under den angivna fasen."""
+
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with metrics.timer(phase, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,238 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from urllib.parse import parse_qsl, quote, urlencode
+from metrics import metrics
+
+
+# Standardfilen där cachen sparas mellan körningar
+CACHE_FILE: str = "weather_cache.json"
+
+# Livslängd i sekunder för varje typ av API-svar. None betyder att posten aldrig blir inaktuell.
+DEFAULT_TTLS: dict[str, float | None] = {
+    "weather?": 10 * 60,  # Nuvarande väder uppdateras ofta hos OpenWeatherMap
+    "forecast?": 60 * 60,  # 5-dagarsprognosen uppdateras var tredje timme
+    "location": 12 * 60 * 60,  # Platsen från användarens IP-adress ändras sällan
+}
+
+# Hur ofta OpenWeatherMap uppdaterar respektive prognostyp, i sekunder. 5-dagarsprognosen har steg om tre timmar.
+# Ett utgånget svar får läsas som inaktuell kopia i högst ett uppdateringsintervall medan det uppdateras i bakgrunden,
+# och sparas därför i cachen (även på disk) så länge efter utgångstiden.
+UPDATE_CADENCE: dict[str, float] = {"weather?": 10 * 60, "forecast?": 3 * 60 * 60}
+
+
+def make_cache_key(kind: str, params: dict[str, Any]) -> str:
+    """Skapar en normaliserad cachenyckel av typen av förfrågan och dess sökparametrar.
+    Parametrarna sorteras och görs om till gemener så att "Stockholm" och " stockholm" ger samma nyckel.
+    Namn och värden URL-kodas, så att ett '&' eller '=' i ett värde inte kan ge samma nyckel som en annan sökning."""
+
+    normalized: list[str] = [
+        f"{quote(str(name).strip().lower(), safe=' ,')}={quote(str(value).strip().lower(), safe=' ,')}"
+        for name, value in sorted(params.items())
+        if value is not None
+    ]
+    return f"{kind}|{'&'.join(normalized)}"
+
+
+def encode_query(params: dict[str, Any]) -> str:
+    """URL-kodar parametrarna till en frågesträng, exempelvis 'q=New%20York&units=metric'.
+    Tecken som '&' och '=' i ett värde kodas, så att ett värde aldrig kan tolkas som en egen parameter."""
+    return urlencode({name: value for name, value in params.items() if value is not None}, quote_via=quote, safe=",")
+
+
+def format_search_params(params: dict[str, Any]) -> str:
+    """Skapar en URL-kodad parametersträng för en söktyp, exempelvis '&q=Stockholm' eller '&lat=59.33&lon=18.07'."""
+    return f"&{encode_query(params)}"
+
+
+def parse_search_params(search_type: str) -> dict[str, str]:
+    """Delar upp en parametersträng som '&q=Stockholm' eller '&lat=1&lon=2' till en dictionary med avkodade värden."""
+    return dict(parse_qsl(search_type.lstrip("&"), keep_blank_values=True))
+
+
+class ResponseCache:
+    """En LRU-cache i minnet för API-svar där varje post har en egen livslängd (TTL).
+    Cachen sparas till disk så att den kan återanvändas nästa gång programmet körs. Ändringar skrivs till disk i en bakgrundstråd,
+    högst en gång per intervall, samt när programmet avslutas, så att många sparningar i rad inte skriver om hela filen varje gång.
+    Vid varje skrivning slås posterna ihop med filen, så att flera processer som delar cachefil inte skriver över varandras svar.
+    Utgångna poster behålls i max_stale sekunder efter utgångstiden, så att de kan läsas som inaktuella kopior med get_stale()."""
+
+    def __init__(
+        self,
+        path: str | None = CACHE_FILE,
+        max_entries: int = 512,
+        ttls: dict[str, float | None] | None = None,
+        save_interval: float = 1.0,
+        max_stale: dict[str, float] | None = None,
+    ) -> None:
+        self.path: str | None = path  # Sökväg till cachefilen, None stänger av lagring på disk
+        self.max_entries: int = max_entries  # Max antal poster innan de äldst använda tas bort
+        self.ttls: dict[str, float | None] = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.save_interval: float = save_interval  # Sparar till disk högst en gång per intervall (sekunder)
+        self.max_stale: dict[str, float] = dict(UPDATE_CADENCE if max_stale is None else max_stale)  # Typ -> hur länge utgångna poster behålls
+        self._entries: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()  # nyckel -> (utgångstid, data)
+        self._lock: threading.Lock = threading.Lock()
+        self._save_lock: threading.Lock = threading.Lock()  # Hålls medan filen skrivs, så att läsningar och sparningar i minnet inte behöver vänta
+        self._dirty: bool = False  # Om det finns ändringar som inte har skrivits till disk
+        self._cleared: bool = False  # Om cachen har tömts sedan den senaste skrivningen, så att filens poster inte ska slås ihop
+        self._saved_at: float = 0.0
+        self._save_timer: threading.Timer | None = None  # Schemalagd skrivning till disk, om en väntar
+        self._load()
+        if self.path is not None:
+            atexit.register(self.save)
+
+    def get(self, key: str) -> Any:
+        """Returnerar den cachade datan för nyckeln, eller None om den saknas eller har gått ut."""
+        with self._lock:
+            kind: str = key.split("|", 1)[0]
+            entry: tuple[float | None, Any] | None = self._entries.get(key)
+            if entry is None:
+                metrics.increment("cache_misses", kind=kind)
+                return None
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                if self._is_discarded(key, expires_at, time.time()):
+                    del self._entries[key]  # Tar bort posten som inte heller får läsas som inaktuell kopia längre
+                metrics.increment("cache_misses", kind=kind)
+                return None
+
+            self._entries.move_to_end(key)  # Markerar posten som senast använd
+            metrics.increment("cache_hits", kind=kind)
+            return value
+
+    def get_stale(self, key: str) -> tuple[Any, float | None]:
+        """Returnerar den senast sparade datan för nyckeln och dess utgångstid, även om posten redan har gått ut.
+        Returnerar (None, None) om nyckeln saknas."""
+        with self._lock:
+            entry: tuple[float | None, Any] | None = self._entries.get(key)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(key)
+            return entry[1], entry[0]
+
+    def put(self, key: str, value: Any, expires_at: float | None = None) -> None:
+        """Sparar datan under nyckeln och schemalägger en skrivning till disk.
+        Om ingen utgångstid anges används den livslängd som gäller för nyckelns typ."""
+        if expires_at is None:
+            kind: str = key.split("|", 1)[0]
+            ttl: float | None = self.ttls.get(kind)
+            expires_at = None if ttl is None else time.time() + ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # Tar bort den post som använts minst nyligen
+            self._schedule_save()
+
+    def clear(self) -> None:
+        """Tömmer cachen både i minnet och på disk."""
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+            self._cleared = True
+        self.save()
+
+    def save(self) -> None:
+        """Skriver osparade ändringar till disk direkt."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+        self._save()
+
+    def _schedule_save(self) -> None:
+        """Markerar att det finns osparade ändringar och startar en skrivning i bakgrunden när sparintervallet har gått,
+        om ingen redan väntar. Anropas med låset hållet."""
+        self._dirty = True
+        if self.path is None or self._save_timer is not None:
+            return
+        delay: float = max(0.0, self._saved_at + self.save_interval - time.monotonic())
+        self._save_timer = threading.Timer(delay, self._save)
+        self._save_timer.daemon = True  # Resten sparas när programmet avslutas
+        self._save_timer.start()
+
+    def _is_discarded(self, key: str, expires_at: float | None, now: float) -> bool:
+        """Returnerar True om posten har gått ut för mer än max_stale sekunder sedan och inte längre ska behållas."""
+        if expires_at is None:
+            return False
+        return expires_at + self.max_stale.get(key.split("|", 1)[0], 0) < now
+
+    def _read(self) -> list[list[Any]]:
+        """Läser in de sparade posterna från disk som [nyckel, utgångstid, data], äldst använda först."""
+        if self.path is None or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return []  # En trasig cachefil ska inte stoppa programmet
+
+    def _load(self) -> None:
+        """Läser in sparade poster från disk. Poster som har gått ut för mer än max_stale sekunder sedan hoppas över."""
+        now: float = time.time()
+        for key, expires_at, value in self._read()[-self.max_entries :]:
+            if not self._is_discarded(key, expires_at, now):
+                self._entries[key] = (expires_at, value)
+
+    def _save(self) -> None:
+        """Slår ihop posterna med filen på disk och skriver dem om det finns osparade ändringar. För nycklar som finns i båda
+        behålls posten med senast utgångstid, så att ett nyare svar från en annan process inte skrivs över av ett äldre.
+        Låset för posterna hålls bara medan de kopieras, inte medan filen skrivs.
+        Skrivs först till en temporär fil så att cachefilen aldrig blir halvfärdig."""
+        if self.path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None  # Nya ändringar efter kopieringen schemalägger en ny skrivning
+                if not self._dirty:
+                    return
+                snapshot: list[tuple[str, tuple[float | None, Any]]] = list(self._entries.items())
+                cleared: bool = self._cleared
+                self._dirty = False
+                self._cleared = False
+                self._saved_at = time.monotonic()
+
+            now: float = time.time()
+            merged: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+            if not cleared:
+                for key, expires_at, value in self._read():
+                    if not self._is_discarded(key, expires_at, now):
+                        merged[key] = (expires_at, value)
+            for key, entry in snapshot:
+                stored: tuple[float | None, Any] | None = merged.get(key)
+                if stored is None or _expiry(stored[0]) <= _expiry(entry[0]):
+                    merged[key] = entry
+                merged.move_to_end(key)  # Den här processens poster räknas som senast använda
+            while len(merged) > self.max_entries:
+                merged.popitem(last=False)
+
+            temp_path: str = f"{self.path}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump([[key, expires_at, value] for key, (expires_at, value) in merged.items()], file)
+                os.replace(temp_path, self.path)
+            except OSError:
+                pass  # Cachen fungerar fortfarande i minnet även om disken inte går att skriva till
+
+
+def _expiry(expires_at: float | None) -> float:
+    """Returnerar utgångstiden som ett tal som kan jämföras, där poster utan utgångstid räknas som nyast."""
+    return math.inf if expires_at is None else expires_at
+
+
+_default_cache: ResponseCache | None = None
+
+
+def default_cache() -> ResponseCache:
+    """Returnerar den cache som delas av alla managers i programmet."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
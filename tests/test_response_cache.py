@@ -0,0 +1,57 @@
+import time
+from pathlib import Path
+from typing import Any
+
+from gazetteer import Gazetteer
+from response_cache import ResponseCache
+from weather_manager import WeatherManager
+
+
+FORECAST_TYPE: str = "weather?"
+SEARCH_TYPE: str = "&q=Stockholm"
+
+
+def test_stale_entry_survives_save_and_reload(tmp_path: Path) -> None:
+    path: str = str(tmp_path / "cache.json")
+    key: str = WeatherManager.cache_key(FORECAST_TYPE, SEARCH_TYPE)
+    cache: ResponseCache = ResponseCache(path=path)
+    cache.put(key, {"name": "Gammal"}, expires_at=time.time() - 1)
+    cache.put(WeatherManager.cache_key(FORECAST_TYPE, "&q=Malmö"), {"name": "Malmö"}, expires_at=time.time() - 24 * 60 * 60)
+    cache.save()
+
+    weather: WeatherManager = WeatherManager("test", cache=ResponseCache(path=path), gazetteer=Gazetteer())
+    revalidated: list[str] = []
+    weather.revalidate = lambda forecast_type, search_type: revalidated.append(search_type)  # type: ignore[method-assign]
+
+    assert weather.read_data(FORECAST_TYPE, SEARCH_TYPE) == {"name": "Gammal"}
+    assert revalidated == [SEARCH_TYPE]
+    assert weather.cache.get_stale(WeatherManager.cache_key(FORECAST_TYPE, "&q=Malmö")) == (None, None)  # För gammal för att behållas
+
+
+def test_save_merges_entries_from_other_processes(tmp_path: Path) -> None:
+    path: str = str(tmp_path / "cache.json")
+    first: ResponseCache = ResponseCache(path=path)
+    second: ResponseCache = ResponseCache(path=path)
+    now: float = time.time()
+
+    first.put("weather?|q=stockholm", {"name": "Ny"}, expires_at=now + 600)
+    first.put("weather?|q=malmö", {"name": "Malmö"}, expires_at=now + 600)
+    first.save()
+    second.put("weather?|q=stockholm", {"name": "Gammal"}, expires_at=now + 60)
+    second.put("weather?|q=lund", {"name": "Lund"}, expires_at=now + 600)
+    second.save()
+
+    reloaded: ResponseCache = ResponseCache(path=path)
+    values: dict[str, Any] = {key: reloaded.get(key) for key in ("weather?|q=stockholm", "weather?|q=malmö", "weather?|q=lund")}
+    assert values == {"weather?|q=stockholm": {"name": "Ny"}, "weather?|q=malmö": {"name": "Malmö"}, "weather?|q=lund": {"name": "Lund"}}
+
+
+def test_clear_is_not_undone_by_merge(tmp_path: Path) -> None:
+    path: str = str(tmp_path / "cache.json")
+    cache: ResponseCache = ResponseCache(path=path)
+    cache.put("weather?|q=stockholm", {"name": "Stockholm"})
+    cache.save()
+
+    cache.clear()
+
+    assert ResponseCache(path=path).get("weather?|q=stockholm") is None
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Any
+
+from gazetteer import Gazetteer
+from response_cache import ResponseCache
+from watchlist import REFRESH_MARGIN, Watchlist
+from weather_manager import WeatherManager
+
+
+FORECAST_TYPE: str = "weather?"
+SEARCH_TYPE: str = "&q=Stockholm"
+
+
+class FakeWeather:
+    """Ersätter WeatherManager i bevakningslistan. De första anropen misslyckas, resten sparar ett svar i cachen."""
+
+    cache_key = staticmethod(WeatherManager.cache_key)
+
+    def __init__(self, failures: int = 0) -> None:
+        self.cache: ResponseCache = ResponseCache(path=None)
+        self.failures: int = failures
+        self.calls: int = 0
+
+    def request_data(self, forecast_type: str, search_type: str, refresh: bool = False, expires_at: float | None = None) -> Any:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("API:et svarar inte")
+        data: dict[str, str] = {"name": "Stockholm"}
+        self.cache.put(self.cache_key(forecast_type, search_type), data, expires_at)
+        return data
+
+
+def live_entries(watchlist: Watchlist) -> list[tuple[float, str]]:
+    """Returnerar de poster i schemat som inte har ersatts."""
+    with watchlist._condition:
+        return [(due, key) for due, key in watchlist._schedule if watchlist._due.get(key) == due]
+
+
+def test_failed_refresh_followed_by_stale_read_keeps_one_schedule_entry() -> None:
+    weather: FakeWeather = FakeWeather(failures=1)
+    watchlist: Watchlist = Watchlist(weather)  # type: ignore[arg-type]
+    key: str = weather.cache_key(FORECAST_TYPE, SEARCH_TYPE)
+    watchlist.add(FORECAST_TYPE, SEARCH_TYPE)
+
+    # Den schemalagda uppdateringen misslyckas och schemaläggs om snart
+    with watchlist._condition:
+        assert watchlist._pop_due(time.time()) == [key]
+    watchlist._refresh(key)
+    assert len(live_entries(watchlist)) == 1
+
+    # En läsning av en inaktuell kopia startar en uppdatering i bakgrunden, som också schemalägger nästa uppdatering
+    weather.cache.put(key, {"name": "Stockholm"}, expires_at=time.time() - 1)
+    assert watchlist.read(FORECAST_TYPE, SEARCH_TYPE) == {"name": "Stockholm"}
+    watchlist._executor.shutdown(wait=True)
+
+    assert weather.calls == 2
+    assert len(live_entries(watchlist)) == 1
+    with watchlist._condition:
+        assert watchlist._pop_due(time.time() + 365 * 24 * 60 * 60) == [key]  # Nyckeln uppdateras bara en gång per tidpunkt
+        assert watchlist._next_due() is None
+
+
+def test_add_schedules_fresh_entry_before_it_expires() -> None:
+    weather: FakeWeather = FakeWeather()
+    watchlist: Watchlist = Watchlist(weather)  # type: ignore[arg-type]
+    key: str = weather.cache_key(FORECAST_TYPE, SEARCH_TYPE)
+    expires_at: float = time.time() + 3600
+    weather.cache.put(key, {"name": "Stockholm"}, expires_at)
+
+    watchlist.add(FORECAST_TYPE, SEARCH_TYPE)
+    watchlist.add(FORECAST_TYPE, SEARCH_TYPE)
+
+    assert live_entries(watchlist) == [(expires_at - REFRESH_MARGIN, key)]
+    with watchlist._condition:
+        assert watchlist._pop_due(time.time()) == []
+
+
+def test_read_data_returns_stale_response_and_revalidates() -> None:
+    weather: WeatherManager = WeatherManager("test", cache=ResponseCache(path=None), gazetteer=Gazetteer())
+    key: str = weather.cache_key(FORECAST_TYPE, SEARCH_TYPE)
+    weather.cache.put(key, {"name": "Gammal"}, expires_at=time.time() - 1)
+    refreshed: threading.Event = threading.Event()
+
+    def request_data(forecast_type: str, search_type: str, refresh: bool = False, expires_at: float | None = None) -> Any:
+        assert refresh
+        weather.cache.put(key, {"name": "Ny"})
+        refreshed.set()
+        return {"name": "Ny"}
+
+    weather.request_data = request_data  # type: ignore[method-assign]
+
+    assert weather.read_data(FORECAST_TYPE, SEARCH_TYPE) == {"name": "Gammal"}
+    assert refreshed.wait(5)
+    assert weather.cache.get(key) == {"name": "Ny"}
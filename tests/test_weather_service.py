@@ -0,0 +1,121 @@
+import asyncio
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import weather_service
+
+from gazetteer import Gazetteer
+from historical_archive import HistoricalArchive
+from historical_data import HistoricalManager
+from response_cache import ResponseCache
+from weather_manager import WeatherManager
+from weather_service import WeatherService
+
+
+class FakeResponse:
+    def __init__(self, body: Any) -> None:
+        self.body: Any = body
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> Any:
+        return self.body
+
+
+class FakeTransport:
+    """Ersätter HttpTransport och sparar alla URL:er som skulle ha skickats till API:erna."""
+
+    def __init__(self, body: Any) -> None:
+        self.body: Any = body
+        self.urls: list[str] = []
+
+    def get(self, url: str, **kwargs: Any) -> FakeResponse:
+        self.urls.append(url)
+        return FakeResponse(self.body)
+
+
+def make_service(transport: FakeTransport) -> WeatherService:
+    weather: WeatherManager = WeatherManager(
+        "owm-nyckel", cache=ResponseCache(path=None), transport=transport, gazetteer=Gazetteer(), base_url="http://owm.test/data/2.5/"  # type: ignore[arg-type]
+    )
+    history: HistoricalManager = HistoricalManager(
+        "wwo-nyckel", transport=transport, archive=HistoricalArchive(":memory:"), base_url="http://wwo.test/past-weather.ashx"  # type: ignore[arg-type]
+    )
+    return WeatherService(weather, history)
+
+
+def test_ampersand_in_query_is_not_forwarded_as_parameter() -> None:
+    transport: FakeTransport = FakeTransport({"name": "Stockholm"})
+    service: WeatherService = make_service(transport)
+
+    status, _ = asyncio.run(service.route("/current", {"q": "Stockholm&units=imperial"}))
+
+    assert status == 200
+    params: dict[str, list[str]] = parse_qs(urlsplit(transport.urls[0]).query)
+    assert params["q"] == ["Stockholm&units=imperial"]
+    assert params["units"] == ["metric"]
+    assert params["appid"] == ["owm-nyckel"]
+
+
+def test_ampersand_in_query_does_not_change_canonical_cache_key() -> None:
+    transport: FakeTransport = FakeTransport({"name": "Stockholm"})
+    service: WeatherService = make_service(transport)
+
+    asyncio.run(service.route("/current", {"q": "Stockholm&units=imperial"}))
+
+    canonical_key: str = WeatherManager.cache_key("weather?", "&q=Stockholm")
+    assert service.weather.cache.get(canonical_key) is None
+    asyncio.run(service.route("/current", {"q": "Stockholm"}))
+    assert len(transport.urls) == 2  # Den vanliga sökningen fick inte det injicerade svaret från cachen
+
+
+def test_ampersand_in_historical_city_cannot_replace_api_key() -> None:
+    transport: FakeTransport = FakeTransport({"data": {"request": [{"type": "City", "query": "X"}], "weather": []}})
+    service: WeatherService = make_service(transport)
+
+    service.history.fetch_historical_data("X&key=annan-nyckel", "2023-01-01")
+
+    params: dict[str, list[str]] = parse_qs(urlsplit(transport.urls[0]).query)
+    assert params["key"] == ["wwo-nyckel"]
+    assert params["q"] == ["X&key=annan-nyckel"]
+
+
+async def exchange(service: WeatherService, request: bytes) -> bytes:
+    """Skickar en rå förfrågan till tjänsten och returnerar allt den svarar innan anslutningen stängs."""
+    server: asyncio.Server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0, limit=weather_service.MAX_LINE_LENGTH)
+    port: int = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response: bytes = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+
+
+def test_too_many_headers_are_rejected() -> None:
+    service: WeatherService = make_service(FakeTransport({}))
+    headers: bytes = b"".join(b"X-Rubrik-%d: 1\r\n" % i for i in range(weather_service.MAX_HEADER_LINES + 1))
+
+    response: bytes = asyncio.run(exchange(service, b"GET /health HTTP/1.1\r\n" + headers + b"\r\n"))
+
+    assert response.startswith(b"HTTP/1.1 431 ")
+
+
+def test_too_long_header_line_is_rejected() -> None:
+    service: WeatherService = make_service(FakeTransport({}))
+    header: bytes = b"X-Rubrik: " + b"a" * weather_service.MAX_LINE_LENGTH + b"\r\n"
+
+    response: bytes = asyncio.run(exchange(service, b"GET /health HTTP/1.1\r\n" + header + b"\r\n"))
+
+    assert response.startswith(b"HTTP/1.1 431 ")
+
+
+def test_idle_connection_is_closed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(weather_service, "IDLE_TIMEOUT", 0.1)
+    service: WeatherService = make_service(FakeTransport({}))
+
+    assert asyncio.run(exchange(service, b"")) == b""
@@ -0,0 +1,238 @@
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple
+from urllib.parse import parse_qsl, urlsplit
+
+from metrics import metrics
+
+
+# Standardfilen där förbrukningen av dagskvoterna sparas mellan körningar
+QUOTA_FILE: str = "upstream_quota.json"
+
+# Prioriteter för anrop mot API:erna. Lägre värde går först.
+INTERACTIVE: int = 0  # En användare väntar på svaret
+BACKGROUND: int = 10  # Bakgrundsuppdateringar som kan vänta
+
+
+class RateLimit(NamedTuple):
+    """Gränserna för en API-nyckel mot en värd."""
+
+    requests_per_minute: float  # Hur många förfrågningar per minut som tillåts i genomsnitt
+    burst: int  # Hur många förfrågningar som får skickas direkt efter varandra innan takten jämnas ut
+    daily_quota: int | None = None  # Max antal förfrågningar per dygn (UTC), None betyder ingen dagsgräns
+
+
+# Gränserna för respektive API:s gratisnivå
+DEFAULT_LIMITS: dict[str, RateLimit] = {
+    "api.openweathermap.org": RateLimit(requests_per_minute=60, burst=10),
+    "api.worldweatheronline.com": RateLimit(requests_per_minute=60, burst=5, daily_quota=500),
+}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+class QuotaExceededError(Exception):
+    """Kastas när dagskvoten för en API-nyckel är förbrukad."""
+
+
+@contextlib.contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Sätter prioriteten för alla anrop mot API:erna inom blocket, exempelvis 'with priority(BACKGROUND):'."""
+    token: contextvars.Token[int] = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """En hink med polletter som fylls på i jämn takt. Varje förfrågan förbrukar en pollett."""
+
+    def __init__(self, rate_per_second: float, capacity: int) -> None:
+        self.rate_per_second: float = rate_per_second
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+
+    def time_until_available(self) -> float:
+        """Fyller på hinken och returnerar hur många sekunder det dröjer innan en pollett finns, 0 om en finns redan nu."""
+        now: float = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate_per_second
+
+    def take(self) -> None:
+        """Förbrukar en pollett."""
+        self.tokens -= 1
+
+
+class QuotaStore:
+    """Håller reda på hur många förfrågningar varje API-nyckel har gjort under dygnet.
+    Förbrukningen sparas till disk så att den finns kvar när programmet startas om."""
+
+    def __init__(self, path: str | None = QUOTA_FILE, save_interval: float = 1.0) -> None:
+        self.path: str | None = path
+        self.save_interval: float = save_interval  # Sparar till disk högst en gång per intervall (sekunder)
+        self._usage: dict[str, dict[str, int | str]] = self._read()  # nyckel -> {"day": "YYYY-MM-DD", "used": antal}
+        self._unsaved: dict[str, int] = {}  # Förfrågningar som ännu inte sparats till disk
+        self._saved_at: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+        atexit.register(self.save)
+
+    @staticmethod
+    def today() -> str:
+        """Returnerar dagens datum i UTC, som är när kvoterna nollställs."""
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def used(self, key: str) -> int:
+        """Returnerar antalet förfrågningar som nyckeln har gjort i dag."""
+        with self._lock:
+            entry: dict[str, int | str] | None = self._usage.get(key)
+            return int(entry["used"]) if entry is not None and entry["day"] == self.today() else 0
+
+    def record(self, key: str) -> None:
+        """Registrerar en förfrågan för nyckeln."""
+        with self._lock:
+            today: str = self.today()
+            entry: dict[str, int | str] | None = self._usage.get(key)
+            if entry is None or entry["day"] != today:
+                entry = self._usage[key] = {"day": today, "used": 0}
+            entry["used"] = int(entry["used"]) + 1
+            self._unsaved[key] = self._unsaved.get(key, 0) + 1
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save_locked()
+
+    def save(self) -> None:
+        """Sparar förbrukningen till disk."""
+        with self._lock:
+            self._save_locked()
+
+    def _read(self) -> dict[str, dict[str, int | str]]:
+        """Läser in den sparade förbrukningen från disk."""
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_locked(self) -> None:
+        """Slår ihop den osparade förbrukningen med filen på disk, så att flera processer som delar fil räknas ihop."""
+        self._saved_at = time.monotonic()
+        if self.path is None or not self._unsaved:
+            return
+
+        stored: dict[str, dict[str, int | str]] = self._read()
+        today: str = self.today()
+        for key, count in self._unsaved.items():
+            entry: dict[str, int | str] = stored.get(key, {"day": today, "used": 0})
+            if entry["day"] != today:
+                entry = {"day": today, "used": 0}
+            entry["used"] = int(entry["used"]) + count
+            stored[key] = entry
+        self._unsaved.clear()
+        self._usage = stored
+
+        temp_path: str = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(stored, file)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass  # Kvoterna räknas fortfarande i minnet även om disken inte går att skriva till
+
+
+class _KeyState:
+    """Polletthink och kö av väntande anrop för en API-nyckel mot en värd."""
+
+    def __init__(self, limit: RateLimit) -> None:
+        self.limit: RateLimit = limit
+        self.bucket: TokenBucket = TokenBucket(limit.requests_per_minute / 60, limit.burst)
+        self.waiters: list[tuple[int, int]] = []  # Heap med (prioritet, köordning)
+        self.condition: threading.Condition = threading.Condition()
+
+
+class UpstreamScheduler:
+    """Schemalägger alla anrop mot API:erna så att varje API-nyckels gränser hålls.
+    Anrop som skulle överskrida minutgränsen får vänta på sin tur istället för att avvisas, och interaktiva anrop går före bakgrundsanrop."""
+
+    def __init__(self, limits: dict[str, RateLimit] | None = None, quota: QuotaStore | None = None) -> None:
+        self.limits: dict[str, RateLimit] = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.quota: QuotaStore = quota if quota is not None else QuotaStore()
+        self._states: dict[str, _KeyState] = {}
+        self._order: itertools.count[int] = itertools.count()
+        self._lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def key_for(url: str) -> tuple[str, str]:
+        """Returnerar (värd, nyckel) för en URL. Nyckeln består av värden och en hash av API-nyckeln, så att API-nyckeln
+        inte sparas i klartext i kvotfilen. Gränserna gäller hela värden, så alla sökvägar (ex. /weather och /forecast) delar nyckel."""
+        parts = urlsplit(url)
+        params: dict[str, str] = dict(parse_qsl(parts.query))
+        api_key: str = params.get("appid") or params.get("key") or ""
+        key_hash: str = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+        return parts.hostname or "", f"{parts.hostname}#{key_hash}"
+
+    def acquire(self, url: str) -> None:
+        """Väntar tills förfrågan till URL:en får skickas och registrerar den mot dagskvoten.
+        Kastar QuotaExceededError om dagskvoten är förbrukad. Värdar utan gränser släpps igenom direkt."""
+        host, key = self.key_for(url)
+        limit: RateLimit | None = self.limits.get(host)
+        if limit is None:
+            return
+
+        self._check_quota(host, key, limit)  # Avvisar direkt istället för att först vänta på en pollett
+
+        with self._lock:
+            state: _KeyState | None = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _KeyState(limit)
+
+        ticket: tuple[int, int] = (_priority.get(), next(self._order))
+        with metrics.timer("scheduler_wait", host=host), state.condition:
+            heapq.heappush(state.waiters, ticket)
+            while True:
+                # Bara anropet först i kön (lägst prioritet, sedan äldst) får ta en pollett
+                if state.waiters[0] == ticket:
+                    wait: float = state.bucket.time_until_available()
+                    if wait == 0:
+                        heapq.heappop(state.waiters)
+                        state.condition.notify_all()  # Släpper fram nästa i kön
+                        # Kvoten kontrolleras och reserveras i samma kritiska sektion som polletten tas,
+                        # så att samtidiga anrop inte kan passera kontrollen innan de andras förfrågningar har registrerats
+                        self._check_quota(host, key, limit)
+                        state.bucket.take()
+                        self.quota.record(key)
+                        break
+                    state.condition.wait(wait)
+                else:
+                    state.condition.wait()
+
+    def _check_quota(self, host: str, key: str, limit: RateLimit) -> None:
+        """Kastar QuotaExceededError om nyckelns dagskvot är förbrukad."""
+        if limit.daily_quota is not None and self.quota.used(key) >= limit.daily_quota:
+            metrics.increment("quota_exceeded", host=host)
+            raise QuotaExceededError(f"Dagskvoten på {limit.daily_quota} förfrågningar mot {host} är förbrukad. Försök igen i morgon.")
+
+
+_default_scheduler: UpstreamScheduler | None = None
+_default_scheduler_lock: threading.Lock = threading.Lock()
+
+
+def default_scheduler() -> UpstreamScheduler:
+    """Returnerar den schemaläggare som delas av hela programmet."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = UpstreamScheduler()
+    return _default_scheduler
@@ -0,0 +1,176 @@
+import argparse
+import heapq
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
+
+from batch import FORECAST_TYPES, parse_location, read_locations
+from metrics import metrics, write_if_enabled
+from response_cache import UPDATE_CADENCE
+from upstream_scheduler import BACKGROUND, priority
+from weather_manager import WeatherManager
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Hur långt efter ett jämnt uppdateringsintervall som den nya datan brukar finnas hos API:et
+PUBLISH_DELAY: float = 60.0
+
+# Hur länge en post räknas som färsk efter att nästa uppdatering har schemalagts, så att uppdateringen hinner bli klar innan posten går ut
+REFRESH_MARGIN: float = 120.0
+
+
+def next_update(forecast_type: str, now: float) -> float:
+    """Returnerar tidpunkten (Unix-tid) då nästa uppdatering av prognostypen finns hos API:et."""
+    cadence: float = UPDATE_CADENCE[forecast_type]
+    return ((now - PUBLISH_DELAY) // cadence + 1) * cadence + PUBLISH_DELAY
+
+
+class Watchlist:
+    """En bevakningslista med platser som hålls uppdaterade i bakgrunden.
+    Varje plats uppdateras strax efter att API:et har publicerat ny data, och läsningar besvaras alltid direkt
+    från den senaste kopian i cachen, även om den har hunnit bli inaktuell medan en uppdatering pågår."""
+
+    def __init__(self, weather: WeatherManager, max_workers: int = 4) -> None:
+        self.weather: WeatherManager = weather
+        self.watched: dict[str, tuple[str, str]] = {}  # Cachenyckel -> (prognostyp, parametersträng)
+        self._schedule: list[tuple[float, str]] = []  # Heap med (tidpunkt för nästa uppdatering, cachenyckel)
+        self._due: dict[str, float] = {}  # Cachenyckel -> den gällande tidpunkten för nästa uppdatering. Poster i heapen som inte stämmer med den är ersatta.
+        self._refreshing: set[str] = set()  # Nycklar som håller på att uppdateras
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers)
+        self._condition: threading.Condition = threading.Condition()
+        self._stopped: bool = False
+
+    def add(self, forecast_type: str, search_type: str) -> None:
+        """Lägger till en plats och prognostyp i bevakningslistan. Platsen uppdateras direkt om den saknas i cachen eller har gått ut."""
+        key: str = self.weather.cache_key(forecast_type, search_type)
+        with self._condition:
+            if key in self.watched:
+                return
+            self.watched[key] = (forecast_type, search_type)
+            _, expires_at = self.weather.cache.get_stale(key)
+            self._schedule_refresh(key, time.time() if expires_at is None else expires_at - REFRESH_MARGIN)
+
+    def read(self, forecast_type: str, search_type: str) -> Any:
+        """Returnerar väderdata för en plats. Bevakade platser besvaras direkt från den senaste kopian, och en inaktuell
+        kopia uppdateras i bakgrunden. Platser som inte bevakas, eller som inte har hämtats än, hämtas som vanligt."""
+        key: str = self.weather.cache_key(forecast_type, search_type)
+        if key in self.watched:
+            data, expires_at = self.weather.cache.get_stale(key)
+            if data is not None:
+                if expires_at is not None and expires_at < time.time():
+                    metrics.increment("stale_reads", kind=forecast_type)
+                    self._refresh_async(key)
+                return data
+        return self.weather.request_data(forecast_type, search_type)
+
+    def start(self) -> "Watchlist":
+        """Startar uppdateringen av bevakningslistan i en bakgrundstråd."""
+        threading.Thread(target=self.run, daemon=True, name="watchlist").start()
+        return self
+
+    def stop(self) -> None:
+        """Stoppar bakgrundsuppdateringen."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._executor.shutdown(wait=False)
+
+    def run(self) -> None:
+        """Väntar på att nästa plats i schemat ska uppdateras och startar uppdateringen, tills stop() anropas."""
+        with self._condition:
+            while not self._stopped:
+                for key in self._pop_due(time.time()):
+                    self._refresh_async(key)
+                due: float | None = self._next_due()
+                self._condition.wait(None if due is None else max(0.0, due - time.time()))  # Väcks tidigare om schemat ändras
+
+    def _schedule_refresh(self, key: str, due: float) -> None:
+        """Sätter tidpunkten för nyckelns nästa uppdatering. En tidigare schemaläggning för samma nyckel ersätts. Anropas med låset hållet."""
+        self._due[key] = due
+        heapq.heappush(self._schedule, (due, key))
+        self._condition.notify()
+
+    def _pop_due(self, now: float) -> list[str]:
+        """Tar bort och returnerar nycklarna vars uppdatering ska starta senast nu. Ersatta poster i heapen hoppas över.
+        Anropas med låset hållet."""
+        keys: list[str] = []
+        while self._schedule and self._schedule[0][0] <= now:
+            due, key = heapq.heappop(self._schedule)
+            if self._due.get(key) == due:
+                del self._due[key]  # Uppdateringen schemalägger nästa tidpunkt när den är klar
+                keys.append(key)
+        return keys
+
+    def _next_due(self) -> float | None:
+        """Returnerar tidpunkten för nästa schemalagda uppdatering, eller None om schemat är tomt. Anropas med låset hållet."""
+        while self._schedule and self._due.get(self._schedule[0][1]) != self._schedule[0][0]:
+            heapq.heappop(self._schedule)  # Tar bort ersatta poster
+        return self._schedule[0][0] if self._schedule else None
+
+    def _refresh_async(self, key: str) -> None:
+        """Startar en uppdatering av nyckeln i trådpoolen, om ingen redan pågår."""
+        with self._condition:
+            if key in self._refreshing or self._stopped:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key)
+
+    def _refresh(self, key: str) -> None:
+        """Hämtar ny data för nyckeln med bakgrundsprioritet och schemalägger nästa uppdatering."""
+        forecast_type, search_type = self.watched[key]
+        update_at: float = next_update(forecast_type, time.time())
+        try:
+            with priority(BACKGROUND):
+                # Posten räknas som färsk tills strax efter nästa uppdatering, som är när den ska hämtas igen
+                self.weather.request_data(forecast_type, search_type, refresh=True, expires_at=update_at + REFRESH_MARGIN)
+        except Exception as e:
+            logger.error("Kunde inte uppdatera %s: %s", key, e)
+            update_at = time.time() + min(REFRESH_MARGIN, UPDATE_CADENCE[forecast_type])  # Försöker igen snart
+        finally:
+            with self._condition:
+                self._refreshing.discard(key)
+                self._schedule_refresh(key, update_at)  # Ersätter en eventuell tidigare schemaläggning av nyckeln
+
+
+def load_watchlist(weather: WeatherManager, locations: Iterable[str], forecast_types: list[str]) -> Watchlist:
+    """Skapar en bevakningslista med alla platser och prognostyper."""
+    watchlist: Watchlist = Watchlist(weather)
+    for location in locations:
+        search_type: str = parse_location(location, weather)
+        for forecast_type in forecast_types:
+            watchlist.add(forecast_type, search_type)
+    return watchlist
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Håller platserna i en bevakningsfil uppdaterade i cachen tills processen avbryts,
+    så att andra körningar av appen kan läsa dem direkt från cachefilen."""
+    from main import OPENWEATHERMAP_API_KEY
+
+    parser = argparse.ArgumentParser(description="Håller bevakade platser uppdaterade i bakgrunden.")
+    parser.add_argument("file", nargs="?", default="-", help="Fil med en plats per rad (stad, 'postnummer,landskod' eller 'lat,lon'). '-' läser från stdin.")
+    parser.add_argument("--type", choices=["current", "forecast", "both"], default="forecast", help="Typ av väderprognos som ska bevakas.")
+    args = parser.parse_args(argv)
+
+    forecast_types: list[str] = list(FORECAST_TYPES.values()) if args.type == "both" else [FORECAST_TYPES[args.type]]
+    weather: WeatherManager = WeatherManager(OPENWEATHERMAP_API_KEY)
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    with source:
+        watchlist: Watchlist = load_watchlist(weather, read_locations(source), forecast_types)
+
+    print(f"Bevakar {len(watchlist.watched)} platser. Avsluta med Ctrl+C.")
+    try:
+        watchlist.run()
+    except KeyboardInterrupt:
+        watchlist.stop()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        write_if_enabled()  # Sparar mätvärdena om de är påslagna (WEATHERAPP_METRICS=1)
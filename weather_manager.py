@@ -1,21 +1,69 @@
-import pyinputplus as py
-import requests
-from requests import Response
-import geocoder
-from typing import Any
+import logging
+import os
+import threading
+import time
+from typing import Any, NamedTuple, TYPE_CHECKING
+from gazetteer import Gazetteer, default_gazetteer
+from metrics import metrics, timed
+from response_cache import ResponseCache, default_cache, encode_query, format_search_params, make_cache_key, parse_search_params
+
+# pyinputplus, geocoder och requests (via http_transport) importeras först i de metoder som använder dem,
+# så att programmet startar snabbt när svaret kan hämtas från cachen eller ingen plats behöver slås upp
+if TYPE_CHECKING:
+    from requests import Response
+    from http_transport import HttpTransport
+
+
+# Bas-URL för OpenWeatherMap. Kan bytas ut med miljövariabeln WEATHERAPP_OWM_BASE_URL, exempelvis mot en lokal testserver.
+OPENWEATHERMAP_BASE_URL: str = os.environ.get("WEATHERAPP_OWM_BASE_URL", "https://api.openweathermap.org/data/2.5/")
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Cachenyckeln för platsinformationen från användarens IP-adress
+LOCATION_CACHE_KEY: str = make_cache_key("location", {"ip": "me"})
+
+
+class IpLocation(NamedTuple):
+    """Platsinformation från användarens IP-adress."""
+
+    country: str  # Landskod, ex. "SE" för Sverige
+    latlng: tuple[float, float]  # Latitud och longitud
 
 
 class WeatherManager:
     """Hanterar inhämtning av extern indata såsom användarens input för typ av prognos, stadsnamn eller postnummer, och IP-adressens koordinater.
     Dessa används sedan för att forma den URL-sträng som behövs för inhämtning av väderprognoserna, antingen nuvarande väder eller en 5-dagars prognos."""
 
-    def __init__(self, openweathermap_api_key: str) -> None:
+    def __init__(
+        self,
+        openweathermap_api_key: str,
+        cache: ResponseCache | None = None,
+        transport: "HttpTransport | None" = None,
+        gazetteer: Gazetteer | None = None,
+        base_url: str = OPENWEATHERMAP_BASE_URL,
+    ) -> None:
         self.API_KEY: str = openweathermap_api_key  # Tilldelar den angivna API-nyckeln
+        self.base_url: str = base_url  # Bas-URL som prognostypen läggs till på, ex. 'https://api.openweathermap.org/data/2.5/'
+        self.cache: ResponseCache = cache if cache is not None else default_cache()  # Cache för tidigare API-svar
+        self._transport: "HttpTransport | None" = transport  # Delad HTTP-anslutningspool, skapas vid första anropet om ingen angetts
+        self.gazetteer: Gazetteer = gazetteer if gazetteer is not None else default_gazetteer()  # Lokalt ortregister
+        self._revalidating: set[str] = set()  # Cachenycklar som håller på att uppdateras i bakgrunden
+        self._revalidating_lock: threading.Lock = threading.Lock()
+
+    @property
+    def transport(self) -> "HttpTransport":
+        """Returnerar HTTP-transporten. Den delade transporten skapas (och requests importeras) först när den behövs."""
+        if self._transport is None:
+            from http_transport import default_transport
+
+            self._transport = default_transport()
+        return self._transport
 
     def get_forecast_choice(self) -> str:
         """Frågar användaren om vilken typ av väderprognos som ska hämtas.
         Returnerar den relevanta url-strängen för den angivna prognostypen,
         antingen 'weather?' eller 'forecast?'"""
+        import pyinputplus as py
 
         menu_choices: list[str] = ["Nuvarande Väder", "5 Dagars Prognos", "Historisk Väderinformation"]
         user_choice: str = py.inputMenu(prompt="\nAnge typ av väderprognos:\n", choices=menu_choices, numbered=True)
@@ -26,6 +74,7 @@ class WeatherManager:
         """Frågar användaren om vilken typ av sökning som ska göras.
         Returnerar den parametersträng som krävs för söktypen i API URL-länken,
         exempelvis '&q={city_name}' för en stadssökning."""
+        import pyinputplus as py
 
         menu_choices: list[str] = ["Stad", "Postnummer", "Nuvarande Plats"]
         user_choice: str = py.inputMenu(prompt="\nAnge typ av sökning:\n", choices=menu_choices, numbered=True)
@@ -34,21 +83,21 @@ class WeatherManager:
         match user_choice:
             case "Stad":
                 city_name: str = py.inputStr(prompt="\nAnge stad: ")
-                type_of_search = f"&q={city_name}"  # Skapar parametersträngen som ska användas i API URL-länken
+                type_of_search = self.city_search_params(city_name)  # Skapar parametersträngen som ska användas i API URL-länken
             case "Postnummer":
                 try:
-                    location: Any = self.get_location()  # Hämtar platsinformation baserat på användarens IP-adress
+                    location: IpLocation | None = self.get_location()  # Hämtar platsinformation baserat på användarens IP-adress
                 except Exception:
                     print("Kunde inte hämta platsdata.")
 
                 country_code: str = location.country  # Tar fram landskoden (ex. "SE" för Sverige)
                 zip_code: str = self.get_zip_code()  # Hämtar in postnummer från användaren i formatet "xxx xx"
-                type_of_search = f"&zip={zip_code},{country_code}"  # Skapar parametersträngen som ska användas i API URL-länken
+                type_of_search = self.zip_search_params(zip_code, country_code)  # Skapar parametersträngen som ska användas i API URL-länken
             case "Nuvarande Plats":
                 try:
                     location = self.get_location()  # Hämtar platsinformation baserat på användarens IP-adress
                     lat, lon = location.latlng  # Hämtar latitud och longitud koordinaterna från den inhämtade platsinformationen
-                    type_of_search = f"&lat={lat}&lon={lon}"  # Skapar parametersträngen som ska användas i API URL-länken
+                    type_of_search = format_search_params({"lat": lat, "lon": lon})  # Skapar parametersträngen som ska användas i API URL-länken
                 except Exception:
                     print("Kunde inte hämta platsdata.")
             case _:
@@ -57,6 +106,7 @@ class WeatherManager:
 
     def get_zip_code(self) -> str:
         """Hämtar in postnummer från användaren. Returnerar det i formatet "xxx xx"."""
+        import pyinputplus as py
 
         # En while-loop som loopar så länge användaren inte anger ett femsiffrigt nummer
         while True:
@@ -68,11 +118,40 @@ class WeatherManager:
                 break  # Breakar loopen
         return zip_code_string  # Returnerar postnumret
 
-    def get_location(self) -> Any:
-        """Hämtar platsinformation genom användaren IP-adress. Returnerar platsinformationen eller None vid fel."""
+    def city_search_params(self, city_name: str) -> str:
+        """Returnerar parametersträngen för en stadssökning. Om staden finns i det lokala ortregistret
+        skickas dess koordinater, annars skickas stadsnamnet som fritext till API:et."""
+        place = self.gazetteer.lookup_city(city_name)
+        if place is not None:
+            return format_search_params({"lat": place.latitude, "lon": place.longitude})
+        return format_search_params({"q": city_name})
+
+    def zip_search_params(self, zip_code: str, country_code: str) -> str:
+        """Returnerar parametersträngen för en postnummersökning. Om postnumret finns i det lokala ortregistret
+        skickas dess koordinater, annars skickas postnumret och landskoden till API:et."""
+        place = self.gazetteer.lookup_postal_code(zip_code, country_code)
+        if place is not None:
+            return format_search_params({"lat": place.latitude, "lon": place.longitude})
+        return format_search_params({"zip": f"{zip_code},{country_code}"})
+
+    @timed("geolocation")
+    def get_location(self) -> IpLocation | None:
+        """Hämtar platsinformation genom användaren IP-adress. Returnerar platsinformationen eller None vid fel.
+        Platsinformationen sparas i cachen, så att den inte behöver hämtas igen vid nästa körning förrän den har gått ut."""
+        cached_location: Any = self.cache.get(LOCATION_CACHE_KEY)
+        if cached_location is not None:
+            return IpLocation(cached_location["country"], tuple(cached_location["latlng"]))
         try:
-            location: Any = geocoder.ip("me")  # Hämtar platsinformation med hjälp av geocoder-modulen och dess ip() funktion
-            return location  # Returnerar platsinformationen
+            import geocoder
+
+            # Hämtar platsinformation med hjälp av geocoder-modulen och dess ip() funktion, genom den delade HTTP-sessionen
+            location: Any = geocoder.ip("me", session=self.transport.session, timeout=self.transport.timeout)
+            if not location.ok:
+                print("Kunde inte hämta platsinformation.")
+                return None
+            ip_location: IpLocation = IpLocation(location.country, tuple(location.latlng))
+            self.cache.put(LOCATION_CACHE_KEY, ip_location._asdict())  # Sparar bara lyckade svar så att ett misslyckat anrop kan göras om
+            return ip_location  # Returnerar platsinformationen
         except Exception as e:
             print(f"Kunde inte hämta platsinformation. Felmeddelande: {e}")
             return None
@@ -80,6 +159,7 @@ class WeatherManager:
     def fetch_data(self, chosen_forecast: str) -> Any:
         """Försöker hämta in väderdata från OpenWeatherMap.
         Returnerar JSON-encodad väderdata vid lyckad inhämtning."""
+        import pyinputplus as py
 
         # If-sats som avgör vilken sträng som ska användas i URL-länken.
         if chosen_forecast == "Nuvarande Väder":
@@ -93,17 +173,8 @@ class WeatherManager:
                 # Anropar metoden get_search_choice() för att inhämta URL-strängen för söktyp
                 search_type: str = self.get_search_choice()
 
-                # Skapar URL-länken
-                url: str = f"https://api.openweathermap.org/data/2.5/{forecast_type}appid={self.API_KEY}&units=metric&lang=sv{search_type}"
-
-                # Försöker hämta in json-datan från URL-länken
-                response: Response = requests.get(url)  # Hämtar API datan och tilldelar den till en variabel
-
-                # Kontrollerar att inhämtningen gick bra
-                response.raise_for_status()
-
-                # Konverterar json-datan och returnerar värdet
-                return response.json()
+                # Hämtar väderdatan, antingen från cachen eller från API:et
+                return self.read_data(forecast_type, search_type)
             except Exception as e:
                 print(
                     f"\nNågot gick fel med sökningen. Kontrollera att du stavade rätt och att du har en internetanslutning!\nFelmeddelande:\n{e}\n"
@@ -111,3 +182,72 @@ class WeatherManager:
                 if py.inputYesNo("\nVill du försöka igen? (y/n): ") == "no":
                     print("Tack för att du använder vår väderapp. Hejdå!")
                     attempt_search = False
+
+    @staticmethod
+    def cache_key(forecast_type: str, search_type: str) -> str:
+        """Skapar cachenyckeln av prognostypen, sökparametrarna samt enheter och språk."""
+        return make_cache_key(forecast_type, {**parse_search_params(search_type), "units": "metric", "lang": "sv"})
+
+    def read_data(self, forecast_type: str, search_type: str) -> Any:
+        """Hämtar väderdata som request_data, men ett cachat svar som har gått ut för högst cachens max_stale sekunder sedan
+        returneras direkt och uppdateras i bakgrunden (stale-while-revalidate), så att användaren inte behöver vänta på API:et."""
+        cache_key: str = self.cache_key(forecast_type, search_type)
+        data, expires_at = self.cache.get_stale(cache_key)
+        if data is not None and expires_at is not None and expires_at < time.time() <= expires_at + self.cache.max_stale.get(forecast_type, 0):
+            metrics.increment("stale_reads", kind=forecast_type)
+            self.revalidate(forecast_type, search_type)
+            return data
+        return self.request_data(forecast_type, search_type)
+
+    def revalidate(self, forecast_type: str, search_type: str) -> None:
+        """Hämtar ny data för sökningen i en bakgrundstråd med bakgrundsprioritet, om ingen uppdatering redan pågår.
+        Tråden är inte en daemon-tråd, så programmet avslutas inte förrän det nya svaret har sparats i cachen."""
+        cache_key: str = self.cache_key(forecast_type, search_type)
+        with self._revalidating_lock:
+            if cache_key in self._revalidating:
+                return
+            self._revalidating.add(cache_key)
+
+        def refresh() -> None:
+            from upstream_scheduler import BACKGROUND, priority
+
+            try:
+                with priority(BACKGROUND):
+                    self.request_data(forecast_type, search_type, refresh=True)
+            except Exception as e:
+                logger.error("Kunde inte uppdatera %s: %s", cache_key, e)
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(cache_key)
+
+        threading.Thread(target=refresh, name="revalidate").start()
+
+    def request_data(self, forecast_type: str, search_type: str, refresh: bool = False, expires_at: float | None = None) -> Any:
+        """Hämtar väderdata för en prognostyp ('weather?' eller 'forecast?') och en parametersträng för söktypen.
+        Returnerar cachad data om ett tillräckligt färskt svar redan finns, annars hämtas datan från OpenWeatherMap.
+        Med refresh=True hämtas datan alltid från API:et, och expires_at anger då hur länge det nya svaret ska räknas som färskt."""
+
+        cache_key: str = self.cache_key(forecast_type, search_type)
+        if not refresh:
+            cached_data: Any = self.cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
+
+        # Skapar URL-länken
+        with metrics.timer("url_build"):
+            # Parametrarna kodas om från grunden och de fasta parametrarna läggs sist, så att en sökning aldrig kan byta ut dem
+            params: dict[str, str] = {**parse_search_params(search_type), "appid": self.API_KEY, "units": "metric", "lang": "sv"}
+            url: str = f"{self.base_url}{forecast_type}{encode_query(params)}"
+
+        # Försöker hämta in json-datan från URL-länken
+        with metrics.timer("http_fetch", api="openweathermap"):
+            response: "Response" = self.transport.get(url)  # Hämtar API datan och tilldelar den till en variabel
+
+        # Kontrollerar att inhämtningen gick bra
+        response.raise_for_status()
+
+        # Konverterar json-datan, sparar den i cachen och returnerar värdet
+        with metrics.timer("json_decode", api="openweathermap"):
+            weather_data: Any = response.json()
+        self.cache.put(cache_key, weather_data, expires_at)
+        return weather_data
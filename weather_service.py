@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+from historical_data import HistoricalManager
+from metrics import metrics
+from response_cache import format_search_params, make_cache_key
+from batch import read_locations
+from watchlist import Watchlist, load_watchlist
+from weather_manager import WeatherManager
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Sökparametrarna som får skickas vidare till OpenWeatherMap
+SEARCH_PARAMS: tuple[str, ...] = ("q", "zip", "lat", "lon")
+
+# Vägarna för nuvarande väder och 5-dagarsprognos och deras motsvarande sträng i URL-länken
+FORECAST_PATHS: dict[str, str] = {"/current": "weather?", "/forecast": "forecast?"}
+
+# Gränser som hindrar inaktiva, halvöppna eller felaktiga klienter från att hålla anslutningar öppna för alltid
+IDLE_TIMEOUT: float = 30.0  # Hur länge (sekunder) en keep-alive-anslutning får vänta på nästa förfrågan
+REQUEST_TIMEOUT: float = 10.0  # Hur länge (sekunder) klienten får på sig att skicka rubrikerna, eller att ta emot svaret
+MAX_LINE_LENGTH: int = 8192  # Längsta tillåtna förfrågnings- eller rubrikrad i byte
+MAX_HEADER_LINES: int = 100  # Max antal rubriker per förfrågan
+
+
+def error_status(error: Exception) -> int:
+    """Returnerar statuskoden som ett fel ska besvaras med. Ogiltiga parametrar (ValueError) ger 400,
+    felsvar från API:erna skickas vidare med samma statuskod och övriga fel ger 502."""
+    from requests import HTTPError, RequestException
+
+    if isinstance(error, HTTPError) and error.response is not None and 400 <= error.response.status_code < 600:
+        return error.response.status_code
+    if isinstance(error, ValueError) and not isinstance(error, RequestException):  # requests JSON-fel ärver också från ValueError
+        return 400
+    return 502
+
+
+def reason(status: int) -> str:
+    """Returnerar statusraden för en statuskod, exempelvis 'Not Found' för 404."""
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class SingleFlight:
+    """Slår ihop samtidiga anrop med samma nyckel så att bara ett av dem går vidare till API:et.
+    Alla som väntar på samma nyckel får dela på resultatet (eller felet) från det enda anropet."""
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Task[Any]] = {}
+        self.calls: int = 0  # Antal anrop som faktiskt gjordes
+        self.shared: int = 0  # Antal anrop som fick dela på ett redan pågående anrop
+
+    async def do(self, key: str, function: Callable[[], Awaitable[Any]]) -> Any:
+        """Kör funktionen för nyckeln, eller väntar på det anrop som redan pågår för samma nyckel.
+        Anropet körs som en egen task så att det inte avbryts för de andra om klienten som startade det kopplar ner."""
+        task: asyncio.Task[Any] | None = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(function())
+            self._in_flight[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class WeatherService:
+    """En asynkron HTTP-tjänst som serverar nuvarande väder, 5-dagarsprognos och historisk väderdata som JSON.
+    Alla anslutningar hanteras i en och samma händelseloop. Endast anropen mot API:et körs i en begränsad trådpool."""
+
+    def __init__(self, weather: WeatherManager, history: HistoricalManager, max_workers: int = 16, watchlist: Watchlist | None = None) -> None:
+        self.weather: WeatherManager = weather
+        self.history: HistoricalManager = history
+        self.watchlist: Watchlist | None = watchlist  # Bevakade platser besvaras direkt från cachen och uppdateras i bakgrunden
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers)
+        self.single_flight: SingleFlight = SingleFlight()
+
+    async def run_blocking(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Kör ett blockerande anrop i trådpoolen utan att blockera händelseloopen."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def route(self, path: str, params: dict[str, str]) -> tuple[int, Any]:
+        """Tar fram statuskod och JSON-svar för en förfrågan."""
+        if path in FORECAST_PATHS:
+            forecast_type: str = FORECAST_PATHS[path]
+            search_params: dict[str, str] = {name: params[name] for name in SEARCH_PARAMS if name in params}
+            if not search_params:
+                return 400, {"error": "Ange q, zip eller lat och lon."}
+
+            search_type: str = format_search_params(search_params)  # Värdena kodas så att '&' och '=' i dem inte blir egna parametrar
+            key: str = make_cache_key(forecast_type, search_params)
+            read: Callable[[str, str], Any] = self.watchlist.read if self.watchlist is not None else self.weather.request_data
+            return 200, await self.single_flight.do(key, lambda: self.run_blocking(read, forecast_type, search_type))
+
+        if path == "/historical":
+            if "q" not in params or "date" not in params:
+                return 400, {"error": "Ange q och date."}
+
+            city, start_date, end_date = params["q"], params["date"], params.get("enddate", params["date"])
+            key = make_cache_key("historical", {"q": city, "date": start_date, "enddate": end_date})
+            return 200, await self.single_flight.do(
+                key, lambda: self.run_blocking(self.history.fetch_historical_range, city, start_date, end_date)
+            )
+
+        if path == "/metrics":
+            return 200, metrics.to_prometheus()
+
+        if path == "/stats":
+            return 200, {"upstream_calls": self.single_flight.calls, "coalesced": self.single_flight.shared}
+
+        return 404, {"error": f"Okänd sökväg: {path}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Hanterar en klientanslutning. Anslutningen hålls öppen för flera förfrågningar (keep-alive) tills klienten stänger den,
+        eller tills den har varit inaktiv i IDLE_TIMEOUT sekunder."""
+        try:
+            while True:
+                try:
+                    request_line: bytes = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                    if not request_line:
+                        break
+                    headers: dict[str, str] | None = await asyncio.wait_for(self.read_headers(reader), REQUEST_TIMEOUT)
+                except ValueError:  # En rad är längre än MAX_LINE_LENGTH
+                    headers = None
+                if headers is None:
+                    await self.send(writer, 431, {"error": "För långa eller för många rubriker."}, keep_alive=False)
+                    break
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.send(writer, 400, {"error": "Ogiltig förfrågan."}, keep_alive=False)
+                    break
+
+                keep_alive: bool = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                if method != "GET":
+                    status, body = 405, {"error": "Endast GET stöds."}
+                else:
+                    url = urlsplit(target)
+                    try:
+                        status, body = await self.route(url.path, dict(parse_qsl(url.query)))
+                    except Exception as e:
+                        logger.error("Kunde inte hämta %s: %s", target, e)
+                        status, body = error_status(e), {"error": str(e)}
+
+                await self.send(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Klienten stängde anslutningen mitt i en förfrågan
+        except asyncio.TimeoutError:
+            pass  # Klienten var inaktiv för länge, eller skickade eller tog emot för långsamt
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_headers(reader: asyncio.StreamReader) -> dict[str, str] | None:
+        """Läser in rubrikerna fram till den tomma raden. Returnerar None om de är fler än MAX_HEADER_LINES."""
+        headers: dict[str, str] = {}
+        for _ in range(MAX_HEADER_LINES + 1):
+            header_line: bytes = await reader.readline()
+            if header_line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = header_line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return None
+
+    @staticmethod
+    async def send(writer: asyncio.StreamWriter, status: int, body: Any, keep_alive: bool) -> None:
+        """Skickar ett JSON-svar till klienten. Svar som redan är text (t.ex. Prometheus-mätvärden) skickas som vanlig text."""
+        if isinstance(body, str):
+            payload: bytes = body.encode("utf-8")
+            content_type: str = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head: str = (
+            f"HTTP/1.1 {status} {reason(status)}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await asyncio.wait_for(writer.drain(), REQUEST_TIMEOUT)  # En klient som slutar läsa ska inte hålla kvar svaret för alltid
+
+    async def serve(self, host: str, port: int) -> None:
+        """Startar tjänsten och kör den tills processen avbryts."""
+        server: asyncio.Server = await asyncio.start_server(self.handle_connection, host, port, backlog=4096, limit=MAX_LINE_LENGTH)
+        print(f"Vädertjänsten lyssnar på http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Startar vädertjänsten med API-nycklarna från main.py."""
+    from main import OPENWEATHERMAP_API_KEY, WORLDWEATHERONLINE_API_KEY
+
+    parser = argparse.ArgumentParser(description="Kör väderappen som en lokal HTTP-tjänst.")
+    parser.add_argument("--host", default="127.0.0.1", help="Adress som tjänsten lyssnar på.")
+    parser.add_argument("--port", type=int, default=8080, help="Port som tjänsten lyssnar på.")
+    parser.add_argument("--workers", type=int, default=16, help="Max antal samtidiga anrop mot API:erna.")
+    parser.add_argument("--watchlist", help="Fil med platser vars nuvarande väder och 5-dagarsprognos hålls uppdaterade i bakgrunden.")
+    args = parser.parse_args(argv)
+
+    weather: WeatherManager = WeatherManager(OPENWEATHERMAP_API_KEY)
+    watchlist: Watchlist | None = None
+    if args.watchlist:
+        with open(args.watchlist, encoding="utf-8") as file:
+            watchlist = load_watchlist(weather, read_locations(file), ["weather?", "forecast?"]).start()
+
+    service: WeatherService = WeatherService(
+        weather, HistoricalManager(WORLDWEATHERONLINE_API_KEY), max_workers=args.workers, watchlist=watchlist
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Vädertjänsten stängdes av.")
+
+
+if __name__ == "__main__":
+    main()